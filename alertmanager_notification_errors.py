@@ -17,21 +17,19 @@ class alertmanager_notification_errors(Bug):
 
         if self.is_using_local_logs():
             logfile = self.local_directory(directory_type='root') + '/alertmanager-service_alertmanager.log'
-            logs = self.read_file(logfile)
+            logs = self.iter_file(logfile, records=True)
         else:
             logfile = "kubectl logs -l 'app=alertmanager-service' -c alertmanager"
-            logs = self.run_command(logfile).stdout
+            logs = [(None, line_number, line) for line_number, line in enumerate(self.run_command(logfile).stdout, 1)]
 
-        line_number = 1
-        for line in logs:
+        for record in logs:
+            line = record[-1]
             if 'Error on notify' in line or 'Notify for alerts failed' in line:
                 r = re.search(regex, line)
                 if r:
                     if r.groups()[0] not in failed_notifications:
                         failed_notifications.append(r.groups()[0])
-                        diagnostic_entry = "%s:%s" %(logfile, line_number)
-                        diagnostic_files.append(diagnostic_entry)
-            line_number += 1
+                        diagnostic_files.append((logfile, record))
 
         if failed_notifications:
             value = code.ERROR
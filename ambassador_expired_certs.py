@@ -83,13 +83,8 @@ class ambassador_expired_certs(Bug):
 
         if value == code.OK:
             if self.is_using_local_logs():
-                errors = None
-                error_message = 'rpc error: code = Unauthenticated desc = not authenticated'
-                if self.is_using_local_logs():
-                    logfile = self.local_directory('commands')+'/journalctl'
-                    errors = self.read_file(logfile, grep=error_message)
-                else:
-                    errors = self.run_command("journalctl|grep '%s'" %error_message).stdout
+                logfile, error_message = self.get_subscriptions()[0]
+                errors = self.get_matches(logfile, error_message)
                 if errors:
                     value = code.INFO
                     message = 'Service authentication errors found in logs. This might not be an issue.'
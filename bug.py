@@ -1,12 +1,33 @@
+import array
+import atexit
 import base64
+import bisect
+import bz2
+import collections
+import collections.abc
+import copy
+import fcntl
+import fnmatch
 import getpass
+import gzip
+import hashlib
+import itertools
 import json
+import mmap
+import multiprocessing
+import pickle
 import re
 import os
+import shlex
+import shutil
 import socket
 import subprocess
+import sys
+import tarfile
 import tempfile
+import threading
 import time
+import zlib
 from OpenSSL import crypto
 from warnings import warn
 from datetime import timedelta, datetime
@@ -16,6 +37,868 @@ import yaml
 import lib.return_codes as code
 from lib.debugger import Debugger
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+try:
+  from re import _parser as sre_parse
+except ImportError:
+  import sre_parse
+
+try:
+  import lzma
+except ImportError:
+  lzma = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# Member tables of the tar archives read so far, indexed by path, size and modification time of the archive
+_tar_indexes = {}
+
+# Names under which the contents of bundle files are cached during the run, indexed by path. Files with the same
+# contents on several nodes share a name.
+_content_names = {}
+
+# Content hashes of bundle files, full or sampled, indexed by path, size, modification time and kind of hash
+_content_digests = {}
+
+# Compression of the local files probed so far, indexed by path, size and modification time
+_compressions = {}
+
+# Dates of the first line of the local log files read so far, indexed by path, size, modification time and
+# assumed year
+_log_starts = {}
+
+# Node directories of the bundles read so far, indexed by root directory
+_bundle_nodes = {}
+
+# Bugchecks whose scan() is running and recording its inputs
+_running_scans = []
+
+# Regexes the configured bugchecks subscribe to, indexed by file, so the first get_matches() of a file scans it for
+# all of them
+_subscriptions = {}
+
+def _filter_log_chunk(arguments):
+  # Process pool entry point used by Bug.__read_local_file_parallel(). It lives at module level so it can be
+  # sent to the worker processes.
+  filename, block, grep, logsfrom = arguments
+  bug = Bug()
+  bug.configure(bootstrap=True, logsfrom=logsfrom)
+  return(bug._Bug__filter_log_chunk(filename, block, grep))
+
+class Lines(collections.abc.Sequence):
+  """ Read only list of lines kept as a single str or bytes buffer plus an array with the offset
+  where each line starts, instead of one object per line. Lines of a bytes buffer are decoded as
+  UTF-8 when they are read, a block at a time when iterating, unless errors is None. Slices share
+  the buffer and offsets of the list they are taken from.
+
+  Only lists of at least min_lines lines are worth keeping as Lines. Smaller ones are returned as
+  lists by split(), read_file() and run_command(). copy() and concatenation return lists.
+
+  Line i spans from offsets[i] to offsets[i + 1] - 1, the character before the next line being its
+  newline. The offset after the last line is one past the end of the buffer when it doesn't end
+  with a newline. The buffer may also be a memoryview, such as one of shared memory, in which case
+  it's copied when pickled.
+  """
+  __slots__ = ['buffer', 'offsets', 'start', 'stop', 'errors']
+  block_size = 1024 * 1024
+  min_lines = 100000
+  # Line breaks other than newlines that splitlines() also splits on
+  other_breaks = {
+    str: ['\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029'],
+    bytes: [b'\r', b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', b'\xc2\x85', b'\xe2\x80\xa8', b'\xe2\x80\xa9'],
+    None: [b'\r']
+  }
+
+  def __init__(self, buffer, offsets, start=0, stop=None, errors='replace'):
+    """ Creates a list of lines from a buffer and its offsets. Use split() or pack() instead.
+
+    Args:
+        buffer (str, bytes or memoryview): Text of the lines
+        offsets (array): Offset where each line starts, followed by the offset after the last one
+        start (int): First line of the list. Default: 0
+        stop (int): Line after the last one of the list. Default: all of them
+        errors (str): Error handling used to decode lines of a bytes buffer, or None to return them as
+            bytes. Default: replace
+    """
+    self.buffer = buffer
+    self.offsets = offsets
+    self.start = start
+    self.stop = len(offsets) - 1 if stop is None else stop
+    self.errors = errors if not isinstance(buffer, str) else None
+
+  def __text(self, start, stop):
+    # Returns the text of the buffer between two offsets as str or bytes
+    text = self.buffer[start:stop]
+    return(text if isinstance(text, (str, bytes)) else text.tobytes())
+
+  @staticmethod
+  def __line_ends(buffer, block=64 * 1024 * 1024):
+    # Returns an array with 0 followed by the offset after each newline in a buffer
+    offsets = array.array('Q', [0])
+    if numpy and isinstance(buffer, bytes):
+      for position in range(0, len(buffer), block):
+        ends = numpy.flatnonzero(numpy.frombuffer(buffer, dtype=numpy.uint8, count=min(block, len(buffer) - position), offset=position) == 10)
+        offsets.frombytes((ends + (position + 1)).astype(numpy.uint64).tobytes())
+    else:
+      offsets.extend([match.end() for match in re.finditer(b'\n' if isinstance(buffer, bytes) else '\n', buffer)])
+    return(offsets)
+
+  @classmethod
+  def split(cls, buffer, errors='replace'):
+    """ Returns the lines of a buffer as buffer.splitlines() would, decoding bytes as UTF-8.
+
+    Args:
+        buffer (str or bytes): Text to split
+        errors (str): Error handling used to decode lines of a bytes buffer, or None to return them as
+            bytes. Default: replace
+
+    Returns:
+        Lines: Lines of the buffer, or a list if it has fewer than min_lines lines or line breaks other
+            than newlines
+    """
+    if [line_break for line_break in cls.other_breaks[type(buffer) if errors or isinstance(buffer, str) else None] if line_break in buffer]:
+      lines = buffer.decode('utf-8', errors) if errors and isinstance(buffer, bytes) else buffer
+      return(lines.splitlines())
+    offsets = cls.__line_ends(buffer)
+    if offsets[-1] != len(buffer):
+      offsets.append(len(buffer) + 1)
+    lines = cls(buffer, offsets, errors=errors)
+    return(lines if len(lines) >= cls.min_lines else list(lines))
+
+  @classmethod
+  def pack(cls, lines):
+    """ Returns a list of str lines as Lines, or the list itself if some of them contain a newline.
+    """
+    if not lines:
+      return(cls('', array.array('Q', [0])))
+    buffer = '\n'.join(lines).encode('utf-8', 'surrogatepass')
+    offsets = cls.__line_ends(buffer)
+    if len(offsets) != len(lines):
+      return(lines)
+    offsets.append(len(buffer) + 1)
+    return(cls(buffer, offsets, errors='surrogatepass'))
+
+  def __len__(self):
+    return(self.stop - self.start)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      start, stop, step = index.indices(len(self))
+      if step != 1:
+        return([self[position] for position in range(start, stop, step)])
+      return(Lines(self.buffer, self.offsets, self.start + start, self.start + max(start, stop), self.errors))
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise(IndexError('Lines index out of range'))
+    index += self.start
+    line = self.__text(self.offsets[index], self.offsets[index + 1] - 1)
+    return(line.decode('utf-8', self.errors) if self.errors else line)
+
+  def __iter__(self):
+    # Lines are split a block at a time, which is much faster than slicing them one by one
+    offsets = self.offsets
+    index = self.start
+    while index < self.stop:
+      end = bisect.bisect_left(offsets, offsets[index] + self.block_size, index + 1, self.stop)
+      block = self.__text(offsets[index], offsets[end] - 1)
+      if self.errors:
+        block = block.decode('utf-8', self.errors)
+      for line in block.split('\n' if isinstance(block, str) else b'\n'):
+        yield line
+      index = end
+
+  def __eq__(self, other):
+    if not isinstance(other, (list, Lines)):
+      return(NotImplemented)
+    return(len(self) == len(other) and all([mine == theirs for mine, theirs in zip(self, other)]))
+
+  __hash__ = None
+
+  def copy(self):
+    return(list(self))
+
+  def __add__(self, other):
+    return(list(self) + list(other))
+
+  def __radd__(self, other):
+    return(list(other) + list(self))
+
+  def __repr__(self):
+    return(repr(list(self)))
+
+  def __sizeof__(self):
+    return(object.__sizeof__(self) + sys.getsizeof(self.buffer) + sys.getsizeof(self.offsets))
+
+  def __getstate__(self):
+    if isinstance(self.buffer, memoryview):
+      return((self.buffer.tobytes(), array.array('Q', self.offsets.tobytes()), self.start, self.stop, self.errors))
+    return((self.buffer, self.offsets, self.start, self.stop, self.errors))
+
+  def __setstate__(self, state):
+    self.buffer, self.offsets, self.start, self.stop, self.errors = state
+
+  @property
+  def nbytes(self):
+    """ Size in bytes or characters of the text of the lines, including their line breaks """
+    return(self.offsets[self.stop] - self.offsets[self.start])
+
+class CacheStatistics(object):
+  """ Counters of the file cache use of the bugchecks run by a process, broken down by cache key and
+  by calling bugcheck. Bugs record their cache accesses here whatever file cache they are configured
+  with, so commands and files that aren't worth caching can be found.
+
+  Hits and misses are counted once per read, such as a read_file() call, whatever number of entries
+  it looked up. The time saved by a hit is estimated as the time the last miss of its key took to
+  produce the contents, or from the miss to the contents being stored for single lookups. Sizes are the
+  length of the text held by the contents.
+  """
+  counters = ['hits', 'misses', 'stored_bytes', 'served_bytes', 'evictions', 'evicted_bytes', 'lock_wait', 'time_saved']
+
+  def __init__(self, max_missed=1024):
+    self.mutex = threading.RLock()
+    self.filename = None
+    self.max_missed = max_missed
+    self.reset()
+
+  def __key(self, filename, filter_string):
+    return(filename if filter_string is None else '%s [%s]' %(filename, filter_string))
+
+  def __sizeof(self, contents):
+    # Returns the length of the text held by some contents, following containers and object attributes
+    if isinstance(contents, (str, bytes)):
+      return(len(contents))
+    if isinstance(contents, Lines):
+      return(contents.nbytes)
+    if isinstance(contents, (list, tuple, set)):
+      if contents and isinstance(next(iter(contents)), str):
+        try:
+          return(sum(map(len, contents)) + len(contents))
+        except TypeError:
+          pass
+      return(sum([self.__sizeof(item) for item in contents]))
+    if isinstance(contents, dict):
+      return(sum([self.__sizeof(key) + self.__sizeof(value) for key, value in contents.items()]))
+    if hasattr(contents, '__dict__'):
+      return(self.__sizeof(vars(contents)))
+    return(0)
+
+  def __add(self, key, bugcheck, **counters):
+    with self.mutex:
+      for table, name in [(self.keys, key), (self.bugchecks, bugcheck)]:
+        if name is None:
+          continue
+        entry = table.setdefault(name, dict.fromkeys(self.counters, 0))
+        for counter, value in counters.items():
+          entry[counter] += value
+
+  def reset(self):
+    """ Clears all the counters
+    """
+    with self.mutex:
+      self.keys = {}
+      self.bugchecks = {}
+      self.sizes = {}
+      self.costs = {}
+      self.missed = collections.OrderedDict()
+
+  def hit(self, filename, filter_string, bugcheck, contents=None):
+    """ Records contents served from the cache. Without contents their size is the one last stored.
+    """
+    key = self.__key(filename, filter_string)
+    size = None if contents is None else self.__sizeof(contents)
+    with self.mutex:
+      self.__add(key, bugcheck, hits=1, served_bytes=self.sizes.get(key, 0) if size is None else size, time_saved=self.costs.get(key, 0))
+
+  def miss(self, filename, filter_string, bugcheck, seconds=None, contents=None):
+    """ Records contents not found in the cache. With the seconds taken to produce the contents
+    they are recorded as the cost of the key, otherwise the time until they are stored is measured.
+    Only the last max_missed keys waiting to be stored are timed.
+    """
+    key = self.__key(filename, filter_string)
+    size = None if contents is None else self.__sizeof(contents)
+    with self.mutex:
+      if seconds is not None:
+        self.costs[key] = seconds
+        if size is not None:
+          self.sizes[key] = size
+      else:
+        self.missed.pop(key, None)
+        self.missed[key] = timer()
+        while len(self.missed) > self.max_missed:
+          self.missed.popitem(last=False)
+      self.__add(key, bugcheck, misses=1)
+
+  def store(self, filename, filter_string, bugcheck, contents):
+    """ Records contents stored in the cache, along with the time taken to produce them since they
+    were missed
+    """
+    key = self.__key(filename, filter_string)
+    size = self.__sizeof(contents)
+    with self.mutex:
+      self.sizes[key] = size
+      if key in self.missed:
+        self.costs[key] = timer() - self.missed.pop(key)
+      self.__add(key, bugcheck, stored_bytes=size)
+
+  def evict(self, filename, filter_string, size):
+    """ Records contents evicted from the cache, with their size as estimated by the cache
+    """
+    self.__add(self.__key(filename, filter_string), None, evictions=1, evicted_bytes=size)
+
+  def wait(self, filename, filter_string, bugcheck, seconds):
+    """ Records the time spent waiting for a cache lock
+    """
+    self.__add(self.__key(filename, filter_string), bugcheck, lock_wait=seconds)
+
+  def get_stats(self, bugcheck=None):
+    """ Returns the counters, with the hit ratio of each key and bugcheck
+
+    Args:
+        bugcheck (str): Only return the counters of this bugcheck. Default: all of them
+
+    Returns:
+        dict: Totals, and counters by key and by bugcheck. With a bugcheck, only its counters.
+    """
+    def with_ratio(entry):
+      entry = dict(entry)
+      entry['hit_ratio'] = round(entry['hits'] / (entry['hits'] + entry['misses']), 3) if entry['hits'] + entry['misses'] else None
+      return(entry)
+
+    with self.mutex:
+      if bugcheck:
+        return(with_ratio(self.bugchecks.get(bugcheck, dict.fromkeys(self.counters, 0))))
+      total = dict.fromkeys(self.counters, 0)
+      for entry in self.keys.values():
+        for counter in self.counters:
+          total[counter] += entry[counter]
+      return({
+        'total': with_ratio(total),
+        'keys': dict([(key, with_ratio(entry)) for key, entry in self.keys.items()]),
+        'bugchecks': dict([(name, with_ratio(entry)) for name, entry in self.bugchecks.items()])
+      })
+
+  def dump(self, filename=None):
+    """ Writes the counters to a JSON file
+
+    Args:
+        filename (str): Path of the file. Default: the one set by dump_at_exit()
+    """
+    filename = filename or self.filename
+    if not filename:
+      return
+    with open(filename, 'w') as file:
+      json.dump(self.get_stats(), file, indent=2, sort_keys=True)
+
+  def dump_at_exit(self, filename):
+    """ Writes the counters to a JSON file when the process exits
+    """
+    with self.mutex:
+      if not self.filename:
+        atexit.register(self.dump)
+      self.filename = filename
+
+# File cache use of the bugchecks run by this process
+_cache_statistics = CacheStatistics()
+
+class BoundedFileCache(object):
+  """ File cache with the same interface as the engine's FileCache, holding contents up to a
+  memory budget. The size of each entry is estimated when it's stored, and the least recently
+  used entries are evicted when the budget is exceeded. Entries locked with lock() are pinned
+  and never evicted until they are unlocked. Statistics about the run are returned by
+  get_stats(), including how many bytes were evicted and then loaded again.
+
+  Large lists of lines and Lines are stored as compressed blocks, using zstd when the zstandard
+  module is available and zlib otherwise. get() returns them as they were stored, as lists or
+  Lines, while iter() decompresses one block at a time.
+  """
+  class __compressed_lines(object):
+    # Lines stored as blocks of newline separated text, compressed separately, along with the number of
+    # lines in each block. The bytes buffer of a Lines is compressed as it is, keeping its line offsets and
+    # error handling so it can be returned as a Lines again.
+    __slots__ = ['blocks', 'counts', 'offsets', 'errors', 'size']
+
+    def __init__(self, lines, block_size):
+      self.blocks = []
+      self.counts = []
+      self.offsets = None
+      self.errors = None
+      if isinstance(lines, Lines):
+        offsets, start = lines.offsets, lines.start
+        while start < lines.stop:
+          end = bisect.bisect_left(offsets, offsets[start] + block_size, start + 1, lines.stop)
+          self.blocks.append(self.__compress(lines.buffer[offsets[start]:offsets[end] - 1]))
+          self.counts.append(end - start)
+          start = end
+        if lines.start:
+          self.offsets = array.array('Q', [offset - offsets[lines.start] for offset in offsets[lines.start:lines.stop + 1]])
+        else:
+          self.offsets = offsets[:lines.stop + 1]
+        self.errors = lines.errors
+      start = 0
+      while self.offsets is None and start < len(lines):
+        end, length = start, 0
+        while end < len(lines) and length < block_size:
+          length += len(lines[end]) + 1
+          end += 1
+        self.blocks.append(self.__compress('\n'.join(lines[start:end]).encode('utf-8', 'surrogatepass')))
+        self.counts.append(end - start)
+        start = end
+      self.size = sys.getsizeof(self) + sum([sys.getsizeof(block) for block in self.blocks]) + 8 * len(self.counts) + sys.getsizeof(self.offsets)
+
+    def __compress(self, data):
+      if zstandard:
+        return(zstandard.ZstdCompressor(level=3).compress(data))
+      return(zlib.compress(data, 1))
+
+    def __decompress(self, data):
+      if zstandard:
+        return(zstandard.ZstdDecompressor().decompress(data))
+      return(zlib.decompress(data))
+
+    def __len__(self):
+      return(sum(self.counts))
+
+    def __iter__(self):
+      for block in self.blocks:
+        data = self.__decompress(block)
+        if self.offsets is None:
+          data = data.decode('utf-8', 'surrogatepass')
+        elif self.errors:
+          data = data.decode('utf-8', self.errors)
+        for line in data.split('\n' if isinstance(data, str) else b'\n'):
+          yield line
+
+    def lines(self):
+      # Returns the stored lines as a list, or as a Lines if they were stored from one
+      if self.offsets is None:
+        return(list(self))
+      return(Lines(b'\n'.join([self.__decompress(block) for block in self.blocks]), self.offsets, errors=self.errors))
+
+  def __init__(self, max_bytes=1024 * 1024 * 1024, compress_size=4 * 1024 * 1024, block_size=1024 * 1024):
+    """ Initializes an empty cache.
+
+    Args:
+        max_bytes (int): Memory budget in bytes. Default: 1GB
+        compress_size (int): Size in bytes from which lists of lines and Lines are compressed. None disables
+            compression. Default: 4MB
+        block_size (int): Size in bytes of the text compressed in each block. Default: 1MB
+    """
+    self.max_bytes = max_bytes
+    self.compress_size = compress_size
+    self.block_size = block_size
+    self.entries = collections.OrderedDict()
+    self.pins = {}
+    self.evicted = set()
+    self.size = 0
+    self.stats = dict.fromkeys(['hits', 'misses', 'evictions', 'evicted_bytes', 'reloads', 'reloaded_bytes', 'peak_bytes', 'compressed_entries', 'compression_saved_bytes'], 0)
+    self.mutex = threading.RLock()
+
+  def __sizeof(self, contents):
+    # Estimates the memory used by an object, following containers and object attributes
+    size = sys.getsizeof(contents)
+    if isinstance(contents, (str, bytes, int, float)):
+      return(size)
+    if isinstance(contents, (list, tuple, set)):
+      size += sum([sys.getsizeof(item) if isinstance(item, str) else self.__sizeof(item) for item in contents])
+    elif isinstance(contents, dict):
+      size += sum([self.__sizeof(key) + self.__sizeof(value) for key, value in contents.items()])
+    elif hasattr(contents, '__dict__'):
+      size += self.__sizeof(vars(contents))
+    return(size)
+
+  def __is_compressible(self, contents):
+    # Returns whether contents are lines that can be stored as compressed blocks: lists of str lines, or Lines
+    # kept in a bytes buffer
+    if isinstance(contents, Lines):
+      return(isinstance(contents.buffer, bytes))
+    return(isinstance(contents, list) and all([isinstance(line, str) for line in contents]))
+
+  def __evict(self):
+    # Evicts the least recently used entries that aren't pinned until the cache fits in its budget
+    for key in list(self.entries):
+      if self.size <= self.max_bytes:
+        break
+      if key in self.pins:
+        continue
+      size = self.entries.pop(key)[1]
+      self.size -= size
+      self.evicted.add(key)
+      self.stats['evictions'] += 1
+      self.stats['evicted_bytes'] += size
+      _cache_statistics.evict(filename=key[0], filter_string=key[1], size=size)
+
+  def __lookup(self, key):
+    # Returns the stored contents for a key, or None, counting the hit or miss
+    with self.mutex:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.stats['misses'] += 1
+        return(None)
+      self.entries.move_to_end(key)
+      self.stats['hits'] += 1
+      return(entry[0])
+
+  def get(self, filename, filter_string=None):
+    """ Returns the contents stored for a file and filter, or False if there are none.
+    """
+    contents = self.__lookup((filename, filter_string))
+    if contents is None:
+      return(False)
+    if isinstance(contents, self.__compressed_lines):
+      return(contents.lines())
+    return(contents)
+
+  def iter(self, filename, filter_string=None):
+    """ Returns an iterator over the lines stored for a file and filter, or False if there are
+    none. Compressed lines are decompressed one block at a time as they are iterated.
+    """
+    contents = self.__lookup((filename, filter_string))
+    if contents is None:
+      return(False)
+    return(iter(contents))
+
+  def put(self, filename, contents, filter_string=None):
+    """ Stores the contents of a file for a filter, evicting other entries if needed. Contents
+    larger than the whole budget are not kept unless they are pinned.
+    """
+    key = (filename, filter_string)
+    size = self.__sizeof(contents)
+    if self.compress_size and size >= self.compress_size and self.__is_compressible(contents):
+      uncompressed, contents = size, self.__compressed_lines(contents, self.block_size)
+      size = contents.size
+      with self.mutex:
+        self.stats['compressed_entries'] += 1
+        self.stats['compression_saved_bytes'] += uncompressed - size
+    with self.mutex:
+      if key in self.entries:
+        self.size -= self.entries.pop(key)[1]
+      if key in self.evicted:
+        self.evicted.discard(key)
+        self.stats['reloads'] += 1
+        self.stats['reloaded_bytes'] += size
+      if size > self.max_bytes and key not in self.pins:
+        # Storing it would evict everything else
+        self.evicted.add(key)
+        self.stats['evictions'] += 1
+        self.stats['evicted_bytes'] += size
+        _cache_statistics.evict(filename=key[0], filter_string=key[1], size=size)
+        return
+      self.entries[key] = (contents, size)
+      self.size += size
+      self.stats['peak_bytes'] = max(self.stats['peak_bytes'], self.size)
+      self.__evict()
+
+  def lock(self, filename, filter_string=None):
+    """ Pins the entry of a file and filter, which may not exist yet, so it isn't evicted while
+    it's being read or loaded. Locks are counted, so every lock() needs an unlock().
+    """
+    key = (filename, filter_string)
+    with self.mutex:
+      self.pins[key] = self.pins.get(key, 0) + 1
+
+  def unlock(self, filename, filter_string=None):
+    """ Releases a pin set by lock()
+    """
+    key = (filename, filter_string)
+    with self.mutex:
+      if self.pins.get(key, 0) > 1:
+        self.pins[key] -= 1
+      else:
+        self.pins.pop(key, None)
+        self.__evict()
+
+  def get_stats(self):
+    """ Returns statistics about the cache since it was created
+
+    Returns:
+        dict: Number of hits, misses, evictions and reloads of evicted entries, the evicted, reloaded,
+            current and peak bytes, the budget, the number of entries and of compressed entries, and the
+            bytes saved by compressing them.
+    """
+    with self.mutex:
+      stats = dict(self.stats)
+      stats['bytes'] = self.size
+      stats['max_bytes'] = self.max_bytes
+      stats['entries'] = len(self.entries)
+    return(stats)
+
+# Shared file caches attached by each process, by process id and path
+_shared_file_caches = {}
+
+def _close_shared_file_caches():
+  for (pid, _), cache in list(_shared_file_caches.items()):
+    if pid == os.getpid():
+      cache.close()
+
+class SharedFileCache(object):
+  """ File cache with the same interface as the engine's FileCache, shared by the processes of a
+  run. Contents are written once to files in a directory of the run, in /dev/shm when it's
+  available so they stay in memory, and the other processes map those files instead of reading
+  and filtering the original files again. Lines are stored as their buffer and offsets and
+  returned as Lines viewing the shared memory. Contents that can't be pickled, like command
+  outputs, are only cached in the process storing them.
+
+  Processes attach to the cache by creating it with the same path, or by receiving it pickled,
+  and are counted in the directory. Caches received several times by a process share the same
+  attachment. The directory is removed when the last process using it closes the cache, which
+  is done on exit.
+  """
+  def __init__(self, path=None, block_size=1024 * 1024):
+    """ Creates the cache of a new run, or attaches to the cache of a running one.
+
+    Args:
+        path (str): Directory of the cache to attach to. Default: a new directory
+        block_size (int): Size in bytes of the text decoded at a time by iter(). Default: 1MB
+    """
+    if not path:
+      parent = '/dev/shm' if os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+      path = tempfile.mkdtemp(prefix='bugchecks-', dir=parent)
+    self.path = path
+    self.block_size = block_size
+    self.mappings = {}
+    self.local = {}
+    self.locks = {}
+    self.closed = False
+    self.stats = dict.fromkeys(['hits', 'misses', 'stored_bytes', 'mapped_bytes'], 0)
+    self.mutex = threading.RLock()
+    self.__update_processes(attach=True)
+    _shared_file_caches[(os.getpid(), path)] = self
+    atexit.unregister(_close_shared_file_caches)
+    atexit.register(_close_shared_file_caches)
+
+  def __getstate__(self):
+    return({'path': self.path, 'block_size': self.block_size})
+
+  def __setstate__(self, state):
+    attached = _shared_file_caches.get((os.getpid(), state['path']))
+    if attached and not attached.closed:
+      self.__dict__ = attached.__dict__
+    else:
+      self.__init__(**state)
+
+  def __is_running(self, pid):
+    try:
+      os.kill(pid, 0)
+    except ProcessLookupError:
+      return(False)
+    except PermissionError:
+      pass
+    return(True)
+
+  def __update_processes(self, attach):
+    # Adds or removes the current process from the ones using the cache, forgetting the ones that are gone
+    # without closing it. Returns the number of processes still using the cache.
+    with open(os.path.join(self.path, 'processes'), 'a+') as file:
+      fcntl.flock(file, fcntl.LOCK_EX)
+      file.seek(0)
+      pids = set([int(pid) for pid in file.read().split()])
+      if attach:
+        pids.add(os.getpid())
+      else:
+        pids.discard(os.getpid())
+      pids = [pid for pid in pids if self.__is_running(pid)]
+      file.seek(0)
+      file.truncate()
+      file.write(' '.join([str(pid) for pid in pids]))
+    return(len(pids))
+
+  def __entry(self, key):
+    return(os.path.join(self.path, hashlib.sha1(repr(key).encode('utf-8')).hexdigest()))
+
+  def __mapping(self, key):
+    # Returns a read only memory map of the entry of a key, or None. Entries replaced by another process are
+    # mapped again.
+    path = self.__entry(key)
+    try:
+      inode = os.stat(path).st_ino
+    except OSError:
+      return(None)
+    with self.mutex:
+      if key in self.mappings and self.mappings[key][1] == inode:
+        return(self.mappings[key][0])
+      with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+      self.mappings[key] = (mapping, inode)
+      self.stats['mapped_bytes'] += len(mapping)
+    return(mapping)
+
+  def __lookup(self, key):
+    # Returns the memory map or the local contents of a key, or None, counting the hit or miss
+    with self.mutex:
+      contents = self.local.get(key)
+      if contents is None:
+        contents = self.__mapping(key)
+      self.stats['misses' if contents is None else 'hits'] += 1
+    return(contents)
+
+  def __iter_lines(self, mapping):
+    # Yields the lines stored in a memory map, decoding about block_size bytes at a time
+    start = mapping.find(b'\n') + 1
+    if not int(mapping[1:start - 1]):
+      return
+    size = len(mapping)
+    while True:
+      stop = min(start + self.block_size, size)
+      if stop < size:
+        newline = mapping.find(b'\n', stop)
+        stop = size if newline < 0 else newline
+      for line in mapping[start:stop].decode('utf-8', 'surrogatepass').split('\n'):
+        yield line
+      if stop >= size:
+        break
+      start = stop + 1
+
+  def __lines_entry(self, lines):
+    # Returns the parts of the entry of a Lines: a header with the error handling used to decode them and the
+    # number of offsets, padded so the offsets after it are aligned, then the offsets and the buffer. Offsets
+    # are moved to positions in the entry, so the memory map of the entry is the buffer of the Lines.
+    count = lines.stop - lines.start + 1
+    header = ('B%s %s' %(lines.errors or '', count)).encode('utf-8')
+    header += b' ' * (7 - len(header) % 8) + b'\n'
+    start, stop = lines.offsets[lines.start], lines.offsets[lines.stop]
+    shift = len(header) + 8 * count - start
+    if numpy:
+      offsets = (numpy.frombuffer(lines.offsets, dtype=numpy.int64, count=count, offset=8 * lines.start) + shift).tobytes()
+    else:
+      offsets = array.array('Q', [offset + shift for offset in lines.offsets[lines.start:lines.stop + 1]]).tobytes()
+    return([header, offsets, memoryview(lines.buffer)[start:stop]])
+
+  def __lines(self, mapping):
+    # Returns the Lines stored in a memory map, viewing it without copying
+    end = mapping.find(b'\n')
+    errors, count = mapping[1:end].decode('utf-8').split(' ')[:2]
+    view = memoryview(mapping)
+    return(Lines(view, view[end + 1:end + 1 + 8 * int(count)].cast('Q'), errors=errors or None))
+
+  def get(self, filename, filter_string=None):
+    """ Returns the contents stored for a file and filter, or False if there are none.
+    """
+    contents = self.__lookup((filename, filter_string))
+    if contents is None:
+      return(False)
+    if not isinstance(contents, mmap.mmap):
+      return(contents)
+    if contents[:1] == b'L':
+      return(list(self.__iter_lines(contents)))
+    if contents[:1] == b'B':
+      return(self.__lines(contents))
+    return(pickle.loads(contents[1:]))
+
+  def iter(self, filename, filter_string=None):
+    """ Returns an iterator over the lines stored for a file and filter, or False if there are
+    none. Lines are decoded from the shared memory a block at a time as they are iterated.
+    """
+    contents = self.__lookup((filename, filter_string))
+    if contents is None:
+      return(False)
+    if isinstance(contents, mmap.mmap) and contents[:1] == b'L':
+      return(self.__iter_lines(contents))
+    return(iter(self.get(filename=filename, filter_string=filter_string)))
+
+  def put(self, filename, contents, filter_string=None):
+    """ Stores the contents of a file for a filter so every process can map them. Lists of lines
+    are stored as text, Lines as their buffer and offsets, and other contents are pickled.
+    """
+    key = (filename, filter_string)
+    try:
+      if isinstance(contents, Lines) and not isinstance(contents.buffer, str):
+        data = self.__lines_entry(contents)
+      elif isinstance(contents, list) and all([isinstance(line, str) for line in contents]):
+        data = [b'L' + ('%s\n%s' %(len(contents), '\n'.join(contents))).encode('utf-8', 'surrogatepass')]
+      else:
+        data = [b'P' + pickle.dumps(contents, pickle.HIGHEST_PROTOCOL)]
+    except Exception:
+      with self.mutex:
+        self.local[key] = contents
+      return
+    path = self.__entry(key)
+    temporary = '%s.%s.%s' %(path, os.getpid(), threading.get_ident())
+    try:
+      with open(temporary, 'wb') as file:
+        for part in data:
+          file.write(part)
+      os.rename(temporary, path)
+    except OSError:
+      # Out of space. Contents are kept only for this process.
+      with self.mutex:
+        self.local[key] = contents
+      return
+    with self.mutex:
+      self.local.pop(key, None)
+      self.stats['stored_bytes'] += sum([len(part) for part in data])
+
+  def lock(self, filename, filter_string=None):
+    """ Takes an exclusive lock on the entry of a file and filter across all the processes, so
+    only one of them loads it. Locks are not reentrant.
+    """
+    key = (filename, filter_string)
+    file = open(self.__entry(key) + '.lock', 'a')
+    fcntl.flock(file, fcntl.LOCK_EX)
+    with self.mutex:
+      self.locks.setdefault(key, []).append(file)
+
+  def unlock(self, filename, filter_string=None):
+    """ Releases a lock taken by lock()
+    """
+    key = (filename, filter_string)
+    with self.mutex:
+      files = self.locks.get(key)
+      if not files:
+        return
+      file = files.pop()
+      if not files:
+        del self.locks[key]
+    fcntl.flock(file, fcntl.LOCK_UN)
+    file.close()
+
+  def get_stats(self):
+    """ Returns statistics about the use of the cache by the current process
+
+    Returns:
+        dict: Number of hits and misses, bytes stored and mapped, the path of the cache and the number
+            of entries.
+    """
+    with self.mutex:
+      stats = dict(self.stats)
+    stats['path'] = self.path
+    try:
+      stats['entries'] = len([name for name in os.listdir(self.path) if len(name) == 40])
+    except OSError:
+      stats['entries'] = 0
+    return(stats)
+
+  def close(self):
+    """ Detaches the current process from the cache, removing the cache if no other process is
+    using it. Contents returned by get() are still valid afterwards.
+    """
+    with self.mutex:
+      if self.closed:
+        return
+      self.closed = True
+      if getattr(_shared_file_caches.get((os.getpid(), self.path)), '__dict__', None) is self.__dict__:
+        del _shared_file_caches[(os.getpid(), self.path)]
+      mappings = self.mappings
+      self.mappings = {}
+      self.local = {}
+    for mapping, _ in mappings.values():
+      try:
+        mapping.close()
+      except BufferError:
+        pass
+    try:
+      if not self.__update_processes(attach=False):
+        shutil.rmtree(self.path, ignore_errors=True)
+    except OSError:
+      pass
+
 class Bug(object):
   """ Base class used to represent a bugcheck. It contains several helper methods
   intended to make writing bugchecks and interacting with the logs or
@@ -36,6 +919,13 @@ class Bug(object):
     """
     self.config = {}
     self.status = {}
+    # Inputs read by the running scan() and why its status can't be kept, if it can't. scan() is replaced by
+    # a method restoring the status of the last run with the same inputs.
+    self.__inputs = None
+    self.__uncacheable = None
+    # Cache lookups of the running read, which are counted in the cache statistics as one hit or miss
+    self.__lookups = None
+    self.scan = self.__fingerprinted_scan
     self.configure(
       bootstrap = True,
       connection = None,
@@ -54,6 +944,7 @@ class Bug(object):
     )
 
   def certificates(self):
+    self.__uncacheable = 'reads certificates'
     retval = self.__certificates(self)
     return(retval)
 
@@ -246,83 +1137,1851 @@ class Bug(object):
       self.parent.debug("%s validation result: %s" %(certname, retval.result), code.LOG_DEBUG)
       return retval
 
-  def __filter_logs(self, lines, filename=None):
+  class __log_timestamps(object):
+    """This class reads the timestamps found at the start of log lines"""
+    months = dict((month, '%02d' %number) for number, month in enumerate(
+      ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1))
+
+    def __init__(self):
+      self.syslog_date = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+      self.syslog_hour = re.compile(r'(\d{2}):(\d{2}):(\d{2})')
+      self.journal_date = re.compile(r'^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec) \d{2}', re.IGNORECASE)
+      self.journal_hour = self.syslog_hour
+      self.go_date = re.compile(r'^[A-Z](\d{4})')
+      self.go_hour = self.syslog_hour
+      # Fixed width prefixes used by the fast parsers
+      self.syslog_prefix = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+      self.journal_prefix = re.compile(r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec) \d{2} \d{2}:\d{2}:\d{2}', re.IGNORECASE)
+      self.go_prefix = re.compile(r'[A-Z]\d{4} \d{2}:\d{2}:\d{2}')
+      # Journalctl and GO dates don't have a year, so assume the date is from the current year
+      self.year = time.ctime().split()[4]
+      # Thousands of lines share the same minute, so its timestamp is only calculated once
+      self.minutes = {}
+      self.wall_minutes = {}
+
+    def identity(self):
+      # Returns what the dates depend on besides the lines: the year assumed for dates without one and the
+      # local time zone
+      return([self.year, list(time.tzname), time.timezone])
+
+    def parse(self, line):
+      # Returns the line date as a unix timestamp or None if the line has no known date format
+      fields = line.split()
+      if len(fields) < 2:
+        return(None)
+      try:
+        if self.syslog_date.match(fields[0]) and self.syslog_hour.match(fields[1]):
+          # Syslog format (^2020-08-20 18:58:27)
+          linedate = time.strptime(fields[0][:10] + " " + fields[1][:8], "%Y-%m-%d %H:%M:%S")
+        elif len(fields) > 2 and self.journal_date.match(fields[0] + " " + fields[1]) and self.journal_hour.match(fields[2]):
+          # Journalctl format: (^Jul 24 11:35:19.017949)
+          linedate = time.strptime(self.year + "-" + fields[0] + "-" + fields[1][:2] + " " + fields[2][:8], "%Y-%b-%d %H:%M:%S")
+        elif self.go_date.match(fields[0]) and self.go_hour.match(fields[1]):
+          # GO format: (^E0820 18:58:27.964890)
+          linedate = time.strptime(self.year + "-" + fields[0][1:3] + "-" + fields[0][3:5] + " " + fields[1][:8], "%Y-%m-%d %H:%M:%S")
+        else:
+          return(None)
+        return(time.mktime(linedate))
+      except (ValueError, OverflowError):
+        return(None)
+
+    def __minute(self, key, prefix, line, date):
+      # Returns the timestamp of the minute in the line prefix, or None if it isn't a valid date
+      minute = self.minutes.get(key)
+      if minute is None:
+        if not prefix.match(line):
+          return(None)
+        try:
+          minute = time.mktime(time.strptime(date, "%Y-%m-%d %H:%M"))
+        except (ValueError, OverflowError):
+          return(None)
+        self.minutes[key] = minute
+      return(minute)
+
+    def __seconds(self, minute, seconds):
+      # Adds the seconds (":SS") of a line to the minute timestamp
+      if minute is None or seconds[:1] != ':' or not seconds[1:].isdigit():
+        return(None)
+      seconds = int(seconds[1:])
+      if seconds > 61:
+        return(None)
+      return(minute + seconds)
+
+    def parse_syslog(self, line):
+      # 2020-08-20 18:58:27
+      key = line[:16]
+      date = self.__seconds(self.__minute(key, self.syslog_prefix, line, key), line[16:19])
+      if date is None:
+        return(self.parse(line))
+      return(date)
+
+    def parse_journal(self, line):
+      # Jul 24 11:35:19
+      key = line[:12].lower()
+      date = None
+      if key[:3] in self.months:
+        minute = self.__minute(key, self.journal_prefix, line, "%s-%s-%s" %(self.year, self.months[key[:3]], key[4:]))
+        date = self.__seconds(minute, line[12:15])
+      if date is None:
+        return(self.parse(line))
+      return(date)
+
+    def parse_go(self, line):
+      # E0820 18:58:27
+      key = line[1:11]
+      date = None
+      if 'A' <= line[:1] <= 'Z':
+        minute = self.__minute(key, self.go_prefix, line, "%s-%s-%s %s" %(self.year, key[:2], key[2:4], key[5:]))
+        date = self.__seconds(minute, line[11:14])
+      if date is None:
+        return(self.parse(line))
+      return(date)
+
+    def __local_minute(self, minute):
+      # Converts a minute counted from the epoch in the log's wall clock to a unix timestamp, the same
+      # way parse() does through mktime. Minutes mktime can't convert are NaN, leaving their lines undated.
+      key = int(minute)
+      if key not in self.wall_minutes:
+        try:
+          self.wall_minutes[key] = time.mktime(time.gmtime(key * 60)[:8] + (-1,))
+        except (ValueError, OverflowError, OSError):
+          self.wall_minutes[key] = float('nan')
+      return(self.wall_minutes[key])
+
+    def parse_block(self, lines, parse):
+      # Vectorized version of the fast parser returned by parser(). Returns an array with the timestamp of
+      # each line (NaN if the line has no date) and an array marking blank lines. Lines that don't match
+      # the fixed width format are handed to the generic parser, which always agrees with the fast ones.
+      if parse == self.parse_syslog:
+        # 2020-08-20 18:58:27
+        width, letters, digits, separators = 19, [], [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18], {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+        year, month, day, hour, minute, second = [0, 1, 2, 3], [5, 6], [8, 9], [11, 12], [14, 15], [17, 18]
+      elif parse == self.parse_journal:
+        # Jul 24 11:35:19
+        width, letters, digits, separators = 15, [0, 1, 2], [4, 5, 7, 8, 10, 11, 13, 14], {3: ' ', 6: ' ', 9: ':', 12: ':'}
+        year, month, day, hour, minute, second = None, None, [4, 5], [7, 8], [10, 11], [13, 14]
+      elif parse == self.parse_go:
+        # E0820 18:58:27
+        width, letters, digits, separators = 14, [], [1, 2, 3, 4, 6, 7, 9, 10, 12, 13], {5: ' ', 8: ':', 11: ':'}
+        year, month, day, hour, minute, second = None, [1, 2], [3, 4], [6, 7], [9, 10], [12, 13]
+      else:
+        width = None
+
+      dates = numpy.full(len(lines), numpy.nan)
+      blank = numpy.zeros(len(lines), dtype=bool)
+      if width:
+        chars = numpy.array(lines, dtype='U%s' %width).view(numpy.uint32).reshape(len(lines), width).astype(numpy.int64)
+        numbers = chars - ord('0')
+        valid = ((numbers[:, digits] >= 0) & (numbers[:, digits] <= 9)).all(axis=1)
+        for position, separator in separators.items():
+          valid &= chars[:, position] == ord(separator)
+
+        def number(positions):
+          value = numpy.zeros(len(lines), dtype=numpy.int64)
+          for position in positions:
+            value = value * 10 + numbers[:, position]
+          return(value)
+
+        if parse == self.parse_journal:
+          lowercase = chars[:, letters] | 0x20
+          abbreviation = lowercase[:, 0] * 0x10000 + lowercase[:, 1] * 0x100 + lowercase[:, 2]
+          months = numpy.zeros(len(lines), dtype=numpy.int64)
+          for name, value in self.months.items():
+            months[abbreviation == ord(name[0]) * 0x10000 + ord(name[1]) * 0x100 + ord(name[2])] = int(value)
+        else:
+          months = number(month)
+        if parse == self.parse_go:
+          valid &= (chars[:, 0] >= ord('A')) & (chars[:, 0] <= ord('Z'))
+        years = number(year) if year else numpy.full(len(lines), int(self.year), dtype=numpy.int64)
+        days, hours, minutes, seconds = number(day), number(hour), number(minute), number(second)
+        valid &= (years >= 1970) & (months >= 1) & (months <= 12) & (days >= 1) & (hours < 24) & (minutes < 60) & (seconds <= 61)
+
+        # Invalid lines are given a safe date so datetime64 conversions don't fail
+        month_dates = numpy.where(valid, (years - 1970) * 12 + months - 1, 0).astype('datetime64[M]')
+        day_dates = month_dates.astype('datetime64[D]') + numpy.where(valid, days - 1, 0).astype('timedelta64[D]')
+        # Days that don't exist in the month (Feb 30) overflow into the next month
+        valid &= day_dates.astype('datetime64[M]') == month_dates
+
+        wall_minutes = day_dates.astype(numpy.int64) * 1440 + hours * 60 + minutes
+        unique, inverse = numpy.unique(wall_minutes[valid], return_inverse=True)
+        local = numpy.array([self.__local_minute(wall_minute) for wall_minute in unique], dtype=numpy.float64)
+        dates[valid] = local[inverse] + seconds[valid]
+        fallback = numpy.flatnonzero(~valid)
+      else:
+        fallback = range(len(lines))
+
+      for index in fallback:
+        date = self.parse(lines[index])
+        if date:
+          dates[index] = date
+        else:
+          blank[index] = not lines[index].strip()
+      return(dates, blank)
+
+    def parser(self, sample):
+      # Detects the date format used by most of the sample lines and returns its fast parser. Lines in
+      # any other format are still handled as the fast parsers fall back to parse().
+      counts = {self.parse_syslog: 0, self.parse_journal: 0, self.parse_go: 0}
+      for line in sample:
+        if self.syslog_prefix.match(line):
+          counts[self.parse_syslog] += 1
+        elif self.journal_prefix.match(line):
+          counts[self.parse_journal] += 1
+        elif self.go_prefix.match(line):
+          counts[self.parse_go] += 1
+      parser = max(counts, key=counts.get)
+      if not counts[parser]:
+        return(self.parse)
+      return(parser)
+
+  class __line_matcher(object):
+    # Tests lines against a grep regex. Lines that don't contain the longest literal required by the regex
+    # are rejected with a substring check before running the regex, and literal greps don't use re at all.
+    def __init__(self, grep):
+      self.grep = grep
+      self.regex = re.compile(grep)
+      self.literal, self.is_literal = self.__required_literal(grep)
+      if self.is_literal:
+        self.match = self.__match_literal
+      elif self.literal:
+        self.match = self.__match_prefiltered
+      else:
+        self.match = self.__match_regex
+
+    def __required_literal(self, grep):
+      # Returns the longest literal found in every match of the regex and whether the regex is only that
+      # literal. Case insensitive regexes have no required literal.
+      try:
+        parsed = sre_parse.parse(grep)
+      except Exception:
+        return(None, False)
+      if parsed.state.flags & re.IGNORECASE:
+        return(None, False)
+      runs = ['']
+      self.__literal_runs(parsed, runs)
+      is_literal = all([op == sre_parse.LITERAL for op, _ in parsed])
+      return(max(runs, key=len) or None, is_literal)
+
+    def __literal_runs(self, items, runs):
+      # Appends the sequences of consecutive literal characters in the parsed regex to runs
+      for op, av in items:
+        if op == sre_parse.LITERAL:
+          runs[-1] += chr(av)
+        elif op == sre_parse.SUBPATTERN and not (len(av) == 4 and (av[1] or av[2])):
+          self.__literal_runs(av[-1], runs)
+        else:
+          runs.append('')
+
+    def __match_literal(self, line):
+      return(self.literal in line)
+
+    def __match_prefiltered(self, line):
+      return(self.literal in line and self.regex.search(line) is not None)
+
+    def __match_regex(self, line):
+      return(self.regex.search(line) is not None)
+
+    def bytes_pattern(self):
+      # Returns a bytes regex finding at least every line the regex matches once decoded, or None. The regex
+      # itself is only used if it doesn't contain anything that behaves differently on bytes: anchors, unicode
+      # classes, negated sets, single characters or case insensitive matching. Otherwise its required literal
+      # is searched for.
+      if self.is_literal:
+        return(re.compile(re.escape((self.literal or '').encode('utf-8'))))
+      if all(ord(character) < 128 for character in self.grep) and not re.search(r'\\[wWsSdDbBAZ]|[\^$]|(?<!\\)\.(?![*+])|\(\?[a-zA-Z]*[iu]', self.grep):
+        return(re.compile(self.grep.encode('utf-8')))
+      if self.literal:
+        return(re.compile(re.escape(self.literal.encode('utf-8'))))
+      return(None)
+
+    def shell_literal(self):
+      # Returns the required literal if it can be safely used with grep -F on the node, or None. Regexes
+      # with escape sequences are left alone as egrep doesn't read them the same way.
+      if self.literal and re.match(r"^[ -&(-\[\]-~]+$", self.literal) and not re.search(r'\\[A-Za-z0-9]', self.grep):
+        return(self.literal)
+      return(None)
+
+  class __archive_member(object):
+    # File object for a member of a tar archive, closing the archive along with the member. Members of
+    # uncompressed archives are read at their offset, while compressed archives are decompressed up to it.
+    def __init__(self, archive, tarinfo):
+      self.archive = tarfile.open(archive, 'r:*')
+      self.file = self.archive.extractfile(tarinfo)
+
+    def __getattr__(self, name):
+      return(getattr(self.file, name))
+
+    def __iter__(self):
+      return(iter(self.file))
+
+    def __enter__(self):
+      return(self)
+
+    def __exit__(self, *args):
+      self.close()
+
+    def close(self):
+      self.file.close()
+      self.archive.close()
+
+  def __split_archive_path(self, path):
+    # Returns the tar archive in a path and the path inside the archive, or None if the path doesn't go
+    # through a tar archive
+    if os.path.exists(path):
+      return(None)
+    parts = path.rstrip('/').split('/')
+    for index in range(1, len(parts)):
+      archive = '/'.join(parts[:index])
+      if os.path.isfile(archive):
+        if self.__tar_index(archive) is None:
+          return(None)
+        return(archive, os.path.normpath('/'.join(parts[index:])))
+    return(None)
+
+  def __tar_index(self, archive):
+    # Returns a dictionary with the members of a tar archive by name, or None if it isn't a tar archive.
+    # The member table is read only once for each archive.
+    stat = os.stat(archive)
+    key = (os.path.realpath(archive), stat.st_size, stat.st_mtime)
+    if key not in _tar_indexes:
+      start = timer()
+      try:
+        with tarfile.open(archive, 'r:*') as tar:
+          _tar_indexes[key] = dict([(os.path.normpath(member.name), member) for member in tar if member.isfile()])
+      except (tarfile.TarError, IOError, OSError, EOFError) as e:
+        self.debug("Could not read %s as a tar archive: %s" %(archive, e), code.LOG_DEBUG)
+        _tar_indexes[key] = None
+      else:
+        self.debug("Indexed %s members of %s in %.2f seconds" %(len(_tar_indexes[key]), archive, timer() - start), code.LOG_DEBUG)
+    return(_tar_indexes[key])
+
+  def __tar_member(self, filename):
+    # Returns the tar archive containing a file, its member information and whether the archive is compressed,
+    # or None if the file isn't inside a tar archive
+    archive = self.__split_archive_path(filename)
+    if not archive:
+      return(None)
+    member = self.__tar_index(archive[0]).get(archive[1])
+    if not member:
+      return(None)
+    return(archive[0], member, self.__compression(archive[0]) is not None)
+
+  def __open_local(self, filename):
+    # Opens a local file in binary mode, reading it from a tar archive if one of its parent directories is one
+    member = self.__tar_member(filename)
+    if member:
+      return(self.__archive_member(member[0], member[1]))
+    return(open(filename, 'rb'))
+
+  def __local_stat(self, filename):
+    # Returns the size and modification time of a local file, which may be inside a tar archive
+    member = self.__tar_member(filename)
+    if member:
+      return(member[1].size, member[1].mtime)
+    stat = os.stat(filename)
+    return(stat.st_size, stat.st_mtime)
+
+  def __is_seekable(self, filename):
+    # Returns whether a local file can be read from an arbitrary offset without decompressing what comes before
+    member = self.__tar_member(filename)
+    return(not (member and member[2]) and not self.__compression(filename))
+
+  def __filter_logs(self, lines, filename=None, records=False):
     #Filter lines according to timestamps and returns a list of lines that match the criteria.
-    #FIXME: This function is very slow
-    output = []
+    if not self.config['logsfrom']:
+      self.debug("Bypassing date filtering", code.LOG_DEBUG)
+      return(lines)
+    return(list(self.__iter_filter_logs(lines, filename=filename, size=len(lines), records=records)))
+
+  def __iter_filter_logs(self, lines, filename=None, size=None, records=False, numpy_threshold=100000, block_size=65536):
+    #Filters lines according to timestamps and yields the ones that match the criteria. Large inputs, or
+    #streams of unknown size, are filtered in blocks using numpy when it's available. With records, lines
+    #are (byte_offset, line_number, line) tuples and only their last item is parsed.
     linedate = None
     logsfrom = self.config['logsfrom']
-    syslog_date = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
-    syslog_hour = re.compile(r'(\d{2}):(\d{2}):(\d{2})')
-    journal_date = re.compile(r'^(jan|feb|mar|apr|may|jun|jul|ago|sep|oct|nov|dec) \d{2}', re.IGNORECASE)
-    journal_hour = syslog_hour
-    go_date = re.compile(r'^[A-Z](\d{4})')
-    go_hour = syslog_hour
-    starttime = time.time()
+    timestamps = self.__log_timestamps()
+    start = timer()
+    total, kept, undated, report = 0, 0, 0, 500000
 
     if not filename:
       filename='logs'
 
-    if logsfrom:
-      self.debug("Filtering %s by date: %s " %(filename, str(time.ctime(logsfrom))), code.LOG_INFO)
-      previous_elapsed = 0
+    if not logsfrom:
+      self.debug("Bypassing date filtering", code.LOG_DEBUG)
       for line in lines:
-        elapsed = int(time.time()-starttime)
-        if elapsed % 10 == 0 and elapsed != previous_elapsed:
-          self.debug("Still working (%ss elapsed)" %elapsed, code.LOG_INFO)
-          previous_elapsed = elapsed
-        fields = line.split()
-        if fields:
-          try:
-            if syslog_date.match(fields[0]) and syslog_hour.match(fields[1]):
-              # Syslog format (^2020-08-20 18:58:27)
-              self.debug('Syslog-style date in line: ' + line, code.LOG_JEDIMASTER)
-              linedate=time.strptime(fields[0] + " " + fields[1].split(',')[0], "%Y-%m-%d %H:%M:%S")
-              linedate=time.mktime(linedate)
-            elif journal_date.match(fields[0] + " " + fields[1]) and journal_hour.match(fields[2]):
-              # Journalctl format: (^Jul 24 11:35:19.017949)
-              self.debug('Journalctl-style date in line: ' + line, code.LOG_JEDIMASTER)
-              # Assume the date is from the current year
-              year = time.ctime().split()[4]
-              linedate=time.strptime(year + "-" + fields[0] + "-" + fields[1] + " " + fields[2].split('.')[0], "%Y-%b-%d %H:%M:%S")
-              linedate=time.mktime(linedate)
-            elif go_date.match(fields[0]) and go_hour.match(fields[1]):
-              # GO format: (^E0820 18:58:27.964890)
-              self.debug('GO-style date in line: ' + line, code.LOG_JEDIMASTER)
-              # Assume the date is from the current year
-              year = time.ctime().split()[4]
-              month = fields[0][1]+fields[0][2]
-              day = fields[0][3]+fields[0][4]
-              linedate=time.strptime(year + "-" + month + "-" + day + " " + fields[1].split('.')[0], "%Y-%m-%d %H:%M:%S")
-              linedate = time.mktime(linedate)
-            else:
-              # Append lines anyway if date couldn't be read and previous date was already in range
-              if linedate:
-                if linedate >= logsfrom:
-                  self.debug("Assuming previous date %s on line: %s" %(time.ctime(linedate),line), code.LOG_JEDI)
-                  output.append(line)
-              else:
-                self.debug("Unknown time format in line: %s" %line, code.LOG_JEDIMASTER)
-          except IndexError:
-            self.debug("Unknown time format in line: %s" %line, code.LOG_JEDIMASTER)
-            if linedate:
-              if linedate >= logsfrom:
-                self.debug("Assuming previous date %s on line: %s" %(time.ctime(linedate),line), code.LOG_JEDI)
-                output.append(line)
-          if linedate:
-            if linedate >= logsfrom:
-              output.append(line)
-            else:
-              self.debug("Skipping line due to date filters: " + line, code.LOG_JEDIMASTER)
-              pass
+        yield line
+      return
+
+    self.debug("Filtering %s by date: %s " %(filename, str(time.ctime(logsfrom))), code.LOG_INFO)
+    lines = iter(lines)
+    block = list(itertools.islice(lines, block_size))
+    parse = timestamps.parser([record[-1] for record in block[:100]] if records else block[:100])
+    self.debug("Using %s to read dates in %s" %(parse.__name__, filename), code.LOG_JEDI)
+
+    if numpy and parse != timestamps.parse and (size is None or size >= numpy_threshold):
+      self.debug("Filtering %s in blocks of %s lines" %(filename, block_size), code.LOG_JEDI)
+      linedate = numpy.nan
+      while block:
+        dates, blank = timestamps.parse_block([record[-1] for record in block] if records else block, parse)
+        dated = ~numpy.isnan(dates)
+        # Carry the previous date forward to the lines without a date
+        index = numpy.where(dated, numpy.arange(len(block)), -1)
+        numpy.maximum.accumulate(index, out=index)
+        filled = numpy.where(index >= 0, dates[index], linedate)
+        with numpy.errstate(invalid='ignore'):
+          keep = (filled >= logsfrom) & ~blank
+        total += len(block)
+        kept += int(numpy.count_nonzero(keep))
+        undated += int(numpy.count_nonzero(~dated & ~blank & ~numpy.isnan(filled)))
+        linedate = filled[-1]
+        for line in itertools.compress(block, keep.tolist()):
+          yield line
+        if total >= report:
+          self.debug("Still working (%s lines filtered)" %total, code.LOG_INFO)
+          report += 500000
+        block = list(itertools.islice(lines, block_size))
     else:
-      self.debug("Bypassing date filtering", code.LOG_DEBUG)
-      output = lines
+      for line in itertools.chain(block, lines):
+        total += 1
+        if total == report:
+          self.debug("Still working (%s lines filtered)" %total, code.LOG_INFO)
+          report += 500000
+        date = parse(line[-1] if records else line)
+        if date:
+          linedate = date
+        elif linedate and (line[-1] if records else line).strip():
+          # Lines without a date are kept if the previous date was already in range
+          undated += 1
+        else:
+          continue
+        if linedate >= logsfrom:
+          kept += 1
+          yield line
+
+    self.debug("%s lines removed (%s remaining, %s assumed the previous date) after filtering %s by date" %(total-kept, kept, undated, filename), code.LOG_DEBUG)
+    elapsed = timer() - start
+    self.debug("Filtering %s took %.2f seconds" %(filename, elapsed), code.LOG_DEBUG)
+
+  def __first_date(self, file, offset, timestamps, probe_size=65536):
+    # Returns the date, start and end offsets of the first dated line starting after offset in a file opened
+    # in binary mode. Gives up after probe_size bytes without a date.
+    file.seek(offset)
+    if offset:
+      file.readline()
+    position = file.tell()
+    while position - offset <= probe_size:
+      line = file.readline()
+      if not line:
+        break
+      date = timestamps.parse(line.decode('utf-8', 'replace'))
+      if date:
+        return(date, position, file.tell())
+      position = file.tell()
+    return(None, position, position)
+
+  def __cache_size(self):
+    # Returns the size limit in bytes of the data kept in the cache directory across runs, or 0 if nothing is
+    # kept. Data is only kept when the cache directory or its size limit are configured.
+    if self.config.get('results_cache_size') is not None:
+      return(self.config['results_cache_size'])
+    return(1024 * 1024 * 1024 if self.config.get('cache_directory') else 0)
+
+  def __cache_directory(self, kind, create=True):
+    # Returns the directory used to keep data of the given kind across runs, or None if nothing is kept or it
+    # can't be written. Defaults to a directory in the user's home, never inside the log files being read.
+    # Without create, returns the directory only if it already exists.
+    if self.config.get('cache_directory'):
+      directory = os.path.join(self.config['cache_directory'], kind)
+    else:
+      directory = os.path.join(os.path.expanduser('~'), '.cache', 'bugchecks', kind)
+    if not create:
+      return(directory if os.path.isdir(directory) else None)
+    if not self.__cache_size():
+      return(None)
+    try:
+      if not os.path.isdir(directory):
+        os.makedirs(directory)
+    except OSError as e:
+      if not os.path.isdir(directory):
+        self.debug("Could not create cache directory %s: %s" %(directory, e), code.LOG_DEBUG)
+        return(None)
+    if not os.access(directory, os.W_OK):
+      return(None)
+    return(directory)
+
+  def __file_identity(self, filename):
+    # Returns what identifies the contents of a local file across runs: its real path, inode, size and
+    # modification time. Members of tar archives take the inode of the archive.
+    member = self.__tar_member(filename)
+    size, mtime = self.__local_stat(filename)
+    return([os.path.realpath(filename), os.stat(member[0] if member else filename).st_ino, size, mtime])
+
+  def __results_file(self, filename, result_key):
+    # Returns the path of the file keeping the output of read_file() for a local file across runs, or None.
+    # Results filtered by date depend on the assumed year and time zone as well as on the file.
+    directory = self.__cache_directory('results')
+    if not directory:
+      return(None)
+    key = json.dumps(self.__file_identity(filename) + [result_key] + self.__log_timestamps().identity())
+    return(os.path.join(directory, hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+  def __load_results(self, filename, result_key):
+    # Returns the output of read_file() kept from a previous run, or None. Results are stored as the number of
+    # lines followed by the lines, separated by newlines and compressed with zlib.
+    if self.config['no_cache']:
+      return(None)
+    try:
+      results_file = self.__results_file(filename, result_key)
+      if not results_file or not os.path.exists(results_file):
+        return(None)
+      start = timer()
+      with open(results_file, 'rb') as file:
+        count, contents = zlib.decompress(file.read()).decode('utf-8').split('\n', 1)
+      os.utime(results_file, None)
+    except Exception as e:
+      self.debug("Could not load cached results for %s: %s" %(filename, e), code.LOG_DEBUG)
+      return(None)
+    output = contents.split('\n') if int(count) else []
+    self.debug("Loaded %s lines of %s from %s in %.2f seconds" %(len(output), filename, results_file, timer() - start), code.LOG_DEBUG)
+    return(output)
+
+  def __store_results(self, filename, result_key, output):
+    # Keeps the output of read_file() for the following runs, removing the least recently used results when
+    # the cache directory goes over its size limit
+    try:
+      results_file = self.__results_file(filename, result_key)
+      if not results_file or os.path.exists(results_file):
+        return
+      contents = zlib.compress(('%s\n%s' %(len(output), '\n'.join(output))).encode('utf-8'))
+      if len(contents) > self.__cache_size() // 4:
+        self.debug("Not keeping results of %s: %s bytes" %(filename, len(contents)), code.LOG_DEBUG)
+        return
+      temporary = '%s.%s' %(results_file, os.getpid())
+      with open(temporary, 'wb') as file:
+        file.write(contents)
+      os.rename(temporary, results_file)
+    except Exception as e:
+      self.debug("Could not keep results of %s: %s" %(filename, e), code.LOG_DEBUG)
+      return
+    self.__trim_cache(['index', 'results', 'commands', 'scans'], self.__cache_size())
+
+  def __command_file(self, command, target_host, all_nodes, cache_invalidation):
+    # Returns the path of the file keeping the output of a command across runs, or None if outputs aren't kept,
+    # as when the cache directory isn't configured. The modification times of the cache_invalidation files on
+    # the node are part of the key, so changing them invalidates the output.
+    if self.is_using_local_logs():
+      return(None)
+    directory = self.__cache_directory('commands')
+    if not directory:
+      return(None)
+    key = [command, target_host, all_nodes]
+    if cache_invalidation:
+      mtimes = self.run_command('stat -c %%Y %s 2>/dev/null' %' '.join([shlex.quote(path) for path in cache_invalidation]), all_nodes=all_nodes)
+      for host in mtimes.hosts:
+        key.append([line.decode('utf-8', 'replace') if isinstance(line, bytes) else line for line in getattr(mtimes, host).stdout])
+    return(os.path.join(directory, hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()))
+
+  def __load_command(self, command_file, cache_ttl):
+    # Returns the outputs of a command by host kept from a previous run, or None if there are none or they are
+    # older than cache_ttl seconds. Lines are stored as text, along with whether they were bytes.
+    if not command_file or self.config['no_cache']:
+      return(None)
+    try:
+      if not os.path.exists(command_file):
+        return(None)
+      with open(command_file) as file:
+        stored = json.load(file)
+    except (IOError, OSError, ValueError) as e:
+      self.debug("Could not load cached output of %s: %s" %(command_file, e), code.LOG_DEBUG)
+      return(None)
+    age = time.time() - stored['time']
+    if age < 0 or age > cache_ttl:
+      self.debug("Cached output of %s expired %.0f seconds ago" %(stored['command'], age - cache_ttl), code.LOG_DEBUG)
+      return(None)
+    hosts = {}
+    for host, result in stored['hosts'].items():
+      hosts[host] = {'exit_code': result['exit_code']}
+      for stream in ['stdout', 'stderr']:
+        lines = result[stream]['lines']
+        if lines is not None and result[stream]['bytes']:
+          lines = [line.encode('utf-8', 'surrogateescape') for line in lines]
+        hosts[host][stream] = lines
+    self.debug("Re-used output of %s from %.0f seconds ago" %(stored['command'], age), code.LOG_DEBUG)
+    return(hosts)
+
+  def __store_command(self, command_file, command, hosts):
+    # Keeps the outputs of a command by host for the following runs. Failed commands aren't kept.
+    if not command_file or [host for host in hosts if hosts[host]['exit_code']]:
+      return
+    stored = {'command': command, 'time': time.time(), 'hosts': {}}
+    for host, result in hosts.items():
+      stored['hosts'][host] = {'exit_code': result['exit_code']}
+      for stream in ['stdout', 'stderr']:
+        lines = None if result[stream] is None else list(result[stream])
+        binary = bool(lines) and isinstance(lines[0], bytes)
+        if binary:
+          lines = [line.decode('utf-8', 'surrogateescape') for line in lines]
+        stored['hosts'][host][stream] = {'bytes': binary, 'lines': lines}
+    try:
+      temporary = '%s.%s' %(command_file, os.getpid())
+      with open(temporary, 'w') as file:
+        json.dump(stored, file)
+      os.rename(temporary, command_file)
+    except (IOError, OSError, TypeError, ValueError) as e:
+      self.debug("Could not keep output of %s: %s" %(command, e), code.LOG_DEBUG)
+      return
+    self.__trim_cache(['index', 'results', 'commands', 'scans'], self.__cache_size())
+
+  def __scan_file(self):
+    # Returns the path of the file keeping the status set by scan() across runs, or None. Bugchecks opt in with
+    # scan.fingerprint in the metadata, or all of them with fingerprint_scans, except for the ones depending on
+    # something other than their inputs, such as the current time, which set scan.fingerprint to false.
+    fingerprint = (self.config.get('scan') or {}).get('fingerprint')
+    if fingerprint == False or not (fingerprint or self.config['fingerprint_scans']):
+      return(None)
+    directory = self.__cache_directory('scans')
+    if not directory:
+      return(None)
+    node_config = self.config['node_config']
+    key = [
+      self.__class__.__name__,
+      self.config.get('version'),
+      self.bug_version,
+      node_config.get('host'),
+      node_config.get('role'),
+      node_config.get('cluster_mode'),
+      node_config.get('debuglogdir'),
+      node_config.get('debugcmddir'),
+      self.config['logsfrom'],
+      self.config['read_files_only_from_last_service_restart']
+    ]
+    return(os.path.join(directory, hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()))
+
+  def __output_digest(self, output):
+    # Returns a hash of the outputs and exit codes of a command on every host it ran on, given as returned by
+    # run_command() or as a dictionary of results by host
+    if not isinstance(output, dict):
+      output = dict([(host, vars(getattr(output, host))) for host in output.hosts])
+    digest = hashlib.sha1()
+    for host in sorted(output):
+      result = output[host]
+      digest.update(('%s\0%s\0' %(host, result.get('exit_code') or 0)).encode('utf-8'))
+      for line in itertools.chain(result.get('stdout') or [], ['\0'], result.get('stderr') or []):
+        digest.update(line if isinstance(line, bytes) else line.encode('utf-8', 'surrogateescape'))
+        digest.update(b'\n')
+    return(digest.hexdigest())
+
+  def __input_fingerprint(self, kind, name):
+    # Returns what identifies an input of scan() as it is now: the identity of local files, the inode, size and
+    # modification time of files on the node, a hash of a directory tree listing or a hash of a command output.
+    # Commands on live nodes aren't run again: their output is the one in the file cache or kept with cache_ttl.
+    # Files that can't be found and commands without such an output have no fingerprint.
+    inputs, self.__inputs = self.__inputs, None
+    try:
+      if kind == 'command':
+        command, all_nodes, cache_ttl, cache_invalidation = name
+        if self.is_using_local_logs():
+          return(self.__output_digest(self.run_command(command, silence_cvpi_warning=True, all_nodes=all_nodes)))
+        output = self.__cache_get(filename=command)
+        if output == False and cache_ttl:
+          output = self.__load_command(self.__command_file(command, self.config['node_config'].get('host'), all_nodes, cache_invalidation), cache_ttl)
+        return(self.__output_digest(output) if output else None)
+      if kind == 'walk':
+        return(hashlib.sha1(json.dumps(list(self.walk(name))).encode('utf-8')).hexdigest())
+      if self.is_using_local_logs():
+        return([self.__file_identity(file) for file in (self.__rotated_members(name) if kind == 'rotated' else [name])])
+      directory, pattern = os.path.split(name)
+      if kind == 'rotated' and not re.search(r'[*?[]', pattern):
+        pattern = "'%s'*" %pattern
+      elif kind != 'rotated':
+        pattern = "'%s'" %pattern
+      output = self.run_command("stat -L -c '%%n %%i %%s %%Y' '%s'/%s" %(directory, pattern)).stdout or []
+      return([line.decode('utf-8', 'replace') if isinstance(line, bytes) else line for line in output])
+    except (IOError, OSError) as e:
+      self.debug("Could not fingerprint %s %s: %s" %(kind, name, e), code.LOG_DEBUG)
+      return(None)
+    finally:
+      self.__inputs = inputs
+
+  def __record_input(self, kind, name, fingerprint=None):
+    # Adds an input read by the running scan() to the ones identifying its status
+    if self.__inputs is None or (kind, name) in self.__inputs:
+      return
+    self.__inputs[(kind, name)] = fingerprint if fingerprint is not None else self.__input_fingerprint(kind, name)
+
+  def __unrecorded(self, method, *args):
+    # Calls a method without recording the inputs it reads, which the caller already recorded
+    inputs, self.__inputs = self.__inputs, None
+    try:
+      return(method(*args))
+    finally:
+      self.__inputs = inputs
+
+  def __iter_unrecorded(self, lines):
+    # Yields the lines of a stream without recording the inputs read to produce them
+    while True:
+      inputs, self.__inputs = self.__inputs, None
+      try:
+        line = next(lines)
+      except StopIteration:
+        return
+      finally:
+        self.__inputs = inputs
+      yield line
+
+  def __load_scan(self, scan_file):
+    # Returns the status and return value of the last run of scan(), or None if there are none or any of its
+    # inputs changed since
+    if not scan_file or self.config['no_cache']:
+      return(None)
+    try:
+      if not os.path.exists(scan_file):
+        return(None)
+      with open(scan_file) as file:
+        stored = json.load(file)
+    except (IOError, OSError, ValueError) as e:
+      self.debug("Could not load the last status of %s: %s" %(self.__class__.__name__, e), code.LOG_DEBUG)
+      return(None)
+    start = timer()
+    for kind, name, fingerprint in stored['inputs']:
+      if self.__input_fingerprint(kind, name) != fingerprint:
+        self.debug("Scanning again as %s %s changed since the last run" %(kind, name), code.LOG_DEBUG)
+        return(None)
+    os.utime(scan_file, None)
+    self.debug("Re-used the last status as its %s inputs are unchanged, checked in %.2f seconds" %(len(stored['inputs']), timer() - start), code.LOG_DEBUG)
+    return(stored)
+
+  def __store_scan(self, scan_file, inputs, value):
+    # Keeps the status, return value and attributes set by scan() along with the fingerprints of its inputs for
+    # the following runs as JSON, unless the scan depended on something that can't be fingerprinted or they
+    # wouldn't be restored as they are
+    if self.__uncacheable:
+      self.debug("Not keeping the status of %s as it %s" %(self.__class__.__name__, self.__uncacheable), code.LOG_DEBUG)
+      return
+    try:
+      stored = {'value': value, 'status': self.status, 'state': self.__scan_state()}
+      if json.loads(json.dumps(stored)) != stored:
+        self.debug("Not keeping the status of %s as it can't be stored as JSON" %self.__class__.__name__, code.LOG_DEBUG)
+        return
+      stored['inputs'] = [[kind, name, fingerprint] for (kind, name), fingerprint in inputs.items()]
+      temporary = '%s.%s' %(scan_file, os.getpid())
+      with open(temporary, 'w') as file:
+        json.dump(stored, file)
+      os.rename(temporary, scan_file)
+    except (IOError, OSError, TypeError, ValueError) as e:
+      self.debug("Could not keep the status of %s: %s" %(self.__class__.__name__, e), code.LOG_DEBUG)
+      return
+    self.__trim_cache(['index', 'results', 'commands', 'scans'], self.__cache_size())
+
+  def __is_scan_state(self, name):
+    # Returns whether an attribute of the bugcheck is one scan() may set for patch(), rather than one of Bug()
+    return(name not in ['bug_version', 'cluster_store', 'config', 'debug', 'filecache', 'scan', 'status'] and not name.startswith('_Bug__'))
+
+  def __scan_state(self):
+    # Returns the attributes of the bugcheck other than the ones of Bug(), which scan() may set for patch()
+    return(dict([(name, value) for name, value in vars(self).items() if self.__is_scan_state(name)]))
+
+  def __fingerprinted_scan(self, *args, **kwargs):
+    # Runs the scan() of the bugcheck, or restores the status and attributes set by its last run when the inputs
+    # it read are unchanged. Scans run from another scan make the outer one depend on inputs it can't see. Scans
+    # given arguments, such as the ones run by patch(), are always run.
+    for running in _running_scans:
+      running.__uncacheable = 'runs %s' %self.__class__.__name__
+    scan_file = None if args or kwargs else self.__scan_file()
+    if not scan_file:
+      return(type(self).scan(self, *args, **kwargs))
+    stored = self.__load_scan(scan_file)
+    if stored:
+      self.status = stored['status']
+      vars(self).update([(name, value) for name, value in stored['state'].items() if self.__is_scan_state(name)])
+      return(stored['value'])
+
+    self.__inputs, self.__uncacheable = {}, None
+    _running_scans.append(self)
+    try:
+      value = type(self).scan(self)
+    finally:
+      _running_scans.remove(self)
+      inputs, self.__inputs = self.__inputs, None
+    self.__store_scan(scan_file, inputs, value)
+    return(value)
+
+  def __trim_cache(self, kinds, max_bytes):
+    # Removes the least recently used files kept in the cache directory for the given kinds of data until they
+    # take no more than max_bytes. Returns the number of bytes removed.
+    files = []
+    for kind in kinds:
+      directory = self.__cache_directory(kind, create=False)
+      if not directory:
+        continue
+      for entry in os.scandir(directory):
+        if entry.is_file():
+          stat = entry.stat()
+          files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    total = sum([file[1] for file in files])
+    removed = 0
+    for _, size, path in files:
+      if total - removed <= max_bytes:
+        break
+      try:
+        os.remove(path)
+        removed += size
+      except OSError as e:
+        self.debug("Could not remove %s: %s" %(path, e), code.LOG_DEBUG)
+    if removed:
+      self.debug("Removed %s bytes from the cache directory" %removed, code.LOG_DEBUG)
+    return(removed)
+
+  def __log_index(self, filename, interval=65536, block_size=1024 * 1024):
+    # Returns a sparse index of a log file as a list of [offset, date, line_number] entries taken about every
+    # interval bytes, where date is the timestamp of the first dated line starting at offset and line_number its
+    # number, so records can be numbered from an indexed offset. Indexes are stored in the cache
+    # directory, keyed by the file path, size and modification time, and rebuilt when the file changes or the
+    # dates would be read differently, as in a new year or another time zone. Returns None if the index can't
+    # be stored, as when the cache directory isn't configured. With no_cache, stored indexes are rebuilt.
+    size, mtime = self.__local_stat(filename)
+    identity = [os.path.realpath(filename), size, mtime, interval, 'lines'] + self.__log_timestamps().identity()
+    index = self.__cache_get(filename=filename, filter_string='%index')
+    if index != False and index['file'] == identity:
+      return(index['entries'])
+
+    directory = self.__cache_directory('index')
+    if not directory:
+      return(None)
+    index_file = os.path.join(directory, hashlib.sha1(identity[0].encode('utf-8')).hexdigest() + '.json')
+    index = None
+    if not self.config['no_cache']:
+      try:
+        with open(index_file) as file:
+          index = json.load(file)
+      except (IOError, OSError, ValueError):
+        pass
+
+    if not index or index.get('file') != identity:
+      start = timer()
+      timestamps = self.__log_timestamps()
+      index = {'file': identity, 'entries': []}
+      with self.__open_local(filename) as file:
+        for offset in range(0, size, interval):
+          date, position, _ = self.__first_date(file, offset, timestamps, probe_size=interval)
+          if date and (not index['entries'] or index['entries'][-1][0] != position):
+            index['entries'].append([position, date])
+        file.seek(0)
+        counted, line_number = 0, 1
+        for entry in index['entries']:
+          line_number += self.__count_newlines(file, entry[0] - counted, block_size)
+          counted = entry[0]
+          entry.append(line_number)
+      try:
+        temporary = '%s.%s' %(index_file, os.getpid())
+        with open(temporary, 'w') as file:
+          json.dump(index, file)
+        os.rename(temporary, index_file)
+      except (IOError, OSError) as e:
+        self.debug("Could not save the index of %s: %s" %(filename, e), code.LOG_DEBUG)
+      self.debug("Indexed %s in %.2f seconds" %(filename, timer() - start), code.LOG_DEBUG)
+      self.__trim_cache(['index', 'results', 'commands', 'scans'], self.__cache_size())
+    else:
+      try:
+        os.utime(index_file, None)
+      except OSError:
+        pass
+      self.debug("Re-used index %s for %s" %(index_file, filename), code.LOG_DEBUG)
+
+    self.__cache_put(filename=filename, contents=index, filter_string='%index')
+    return(index['entries'])
+
+  def __count_newlines(self, file, size, block_size=1024 * 1024):
+    # Returns the number of newlines in the next size bytes of a file opened in binary mode, reading it in blocks
+    count = 0
+    while size > 0:
+      data = file.read(min(block_size, size))
+      if not data:
+        break
+      count += data.count(b'\n')
+      size -= len(data)
+    return(count)
+
+  def __line_number(self, filename, offset, indexed=False):
+    # Returns the number of the line starting at offset in a local file. With indexed, newlines are counted from
+    # the closest line of the file's index before offset, otherwise from the start of the file.
+    position, line_number = 0, 1
+    entries = self.__log_index(filename) if indexed else None
+    if entries:
+      closest = bisect.bisect_right([entry[0] for entry in entries], offset) - 1
+      if closest >= 0:
+        position, line_number = entries[closest][0], entries[closest][2]
+    with self.__open_local(filename) as file:
+      file.seek(position)
+      return(line_number + self.__count_newlines(file, offset - position))
+
+  def __logsfrom_offset(self, filename, probe_size=65536):
+    # Returns the offset of the first line dated at or after logsfrom in a time ordered log file, using the
+    # file's index or a binary search if the index is not available. Lines before that offset would be
+    # discarded by __filter_logs anyway, including the undated ones as their previous date is out of range.
+    # Returns 0 if the file doesn't look time ordered.
+    logsfrom = self.config['logsfrom']
+    timestamps = self.__log_timestamps()
+    entries = self.__log_index(filename, interval=probe_size)
+
+    with self.__open_local(filename) as file:
+      size = self.__local_stat(filename)[0]
+      if entries is not None:
+        dates = [entry[1] for entry in entries]
+        if not dates or any(later < earlier for earlier, later in zip(dates, dates[1:])):
+          self.debug("%s doesn't look time ordered. Not seeking." %filename, code.LOG_DEBUG)
+          return(0)
+        if dates[0] >= logsfrom:
+          return(0)
+        low = entries[bisect.bisect_left(dates, logsfrom) - 1][0]
+      else:
+        first, _, _ = self.__first_date(file, 0, timestamps, probe_size)
+        last, _, _ = self.__first_date(file, max(0, size - probe_size), timestamps, probe_size)
+        if not first or not last or last < first:
+          self.debug("%s doesn't look time ordered. Not seeking." %filename, code.LOG_DEBUG)
+          return(0)
+        if first >= logsfrom:
+          return(0)
+
+        low, high = 0, size
+        while high - low > probe_size:
+          middle = (low + high) // 2
+          date, _, end = self.__first_date(file, middle, timestamps, probe_size)
+          if date and date < logsfrom:
+            low = end
+          else:
+            high = middle
+
+      file.seek(low)
+      position = low
+      for line in iter(file.readline, b''):
+        date = timestamps.parse(line.decode('utf-8', 'replace'))
+        if date and date >= logsfrom:
+          break
+        position = file.tell()
+      else:
+        position = size
+
+    self.debug("Skipping %s of %s bytes in %s before %s" %(position, size, filename, time.ctime(logsfrom)), code.LOG_DEBUG)
+    return(position)
+
+  def __read_file_options(self, filename, force_time_filter=False, from_last=None, grep=None):
+    # Returns the delimiter, the regex and whether the file has to be filtered by date when reading a file
+    class log_delimiter(object):
+      def __init__(self, bug):
+        self.logfile = {}
+        self.logfile[bug.local_directory(directory_type='logs')+'/hbasemaster'] = 'server.Server: Started'
+        self.logfile[bug.local_directory(directory_type='logs')+'/elasticsearch-server/es-cluster.log'] = '] started'
+        self.logfile[bug.local_directory(directory_type='logs')+'/aaa/aaa.stderr.log'] = 'Initializing auth providers map'
+        self.logfile[bug.local_directory(directory_type='logs')+'/user/user-upgrade.log'] = 'Upgrading user component'
+
+      def get_delimiter(self, logfile):
+        delimiter = None
+        for definition in self.logfile.keys():
+          if definition in logfile:
+            delimiter = self.logfile[definition]
+        return(delimiter)
+
+    delimiter = None
+    log_suffixes = ['log', 'out', 'journalctl', 'kubelet_journalctl', 'coredns']
+
+    if self.config['read_files_only_from_last_service_restart']:
+      if from_last:
+        delimiter = from_last
+      else:
+        delimiter = log_delimiter(self)
+        delimiter = delimiter.get_delimiter(filename)
+      if not delimiter:
+        self.debug("No delimiter found for %s" %filename , code.LOG_DEBUG)
+    else:
+      self.debug("Bypassing service last restart filtering", code.LOG_DEBUG)
+
+    if delimiter and grep:
+      if grep.startswith('(') and (grep.endswith(')') and not grep.endswith(r'\)')):
+        grep = grep.split('(')[1].split(')')[0].split('|')
+      else:
+        grep = [grep]
+      grep.append(delimiter)
+      grep = '|'.join(grep)
+      grep = '(%s)' %grep
+      self.debug("Formatted regex search: %s" %grep, code.LOG_JEDI)
 
-    elapsed = int(time.time()-starttime)
-    self.debug("Filtering %s took %s seconds" %(filename, elapsed), code.LOG_DEBUG)
+    # Rotated and compressed logs are recognized by the name of the original log
+    logname = re.sub(r'(\.\d+|-\d{8,})?(\.(gz|bz2|xz))?$', '', filename)
+    time_filter = logname.split('.')[-1].split('/')[-1] in log_suffixes or force_time_filter
+    return(delimiter, grep, time_filter)
+
+  def __delimiter_offset(self, filename, delimiter, time_filter, block_size=65536):
+    # Returns the offset of the last line containing the delimiter in a local file, reading it backwards in
+    # blocks so only the tail of the file is read. Returns 0 if the delimiter isn't found or the file has to
+    # be read from the start, which happens when the line has no date for the following lines to take.
+    pattern = delimiter.encode('utf-8')
+    size = self.__local_stat(filename)[0]
+    start = timer()
+    with self.__open_local(filename) as file:
+      end = size
+      position = -1
+      while end > 0 and position < 0:
+        begin = max(0, end - block_size)
+        file.seek(begin)
+        # Blocks overlap so delimiters crossing the end of a block are found
+        index = file.read(end - begin + len(pattern) - 1).rfind(pattern)
+        if index >= 0:
+          position = begin + index
+        end = begin
+      if position < 0:
+        self.debug("Couldn't find any occurrences of %s reading %s backwards." %(delimiter, filename), code.LOG_DEBUG)
+        return(0)
+
+      while position > 0:
+        begin = max(0, position - block_size)
+        file.seek(begin)
+        index = file.read(position - begin).rfind(b'\n')
+        if index >= 0:
+          position = begin + index + 1
+          break
+        position = begin
+      file.seek(position)
+      line = file.readline().decode('utf-8', 'replace').splitlines()
+      line = line[0] if line else ''
+
+    if delimiter not in line:
+      return(0)
+    if time_filter and self.config['logsfrom'] and not self.__log_timestamps().parse(line):
+      self.debug("Delimiter line in %s has no date. Reading the whole file." %filename, code.LOG_DEBUG)
+      return(0)
+    self.debug("Found the last %s at offset %s of %s in %.2f seconds" %(delimiter, position, filename, timer() - start), code.LOG_DEBUG)
+    return(position)
+
+  def __local_cache_keys(self, filename, grep, time_filter, delimiter=None):
+    # Returns the offset a local file should be read from and the cache keys for its raw and grepped
+    # contents. Contents read from an offset are cached separately from the full file.
+    offset = 0
+    if time_filter and self.config['logsfrom'] and self.__is_seekable(filename):
+      offset = self.__logsfrom_offset(filename)
+    if delimiter and self.__is_seekable(filename):
+      offset = max(offset, self.__delimiter_offset(filename, delimiter, time_filter))
+    if offset:
+      raw_key = '@%s' %offset
+      grep_key = '%s@%s' %(grep, offset) if grep else None
+    else:
+      raw_key = None
+      grep_key = grep
+    return(offset, raw_key, grep_key)
+
+  def __result_key(self, kind, grep, time_filter, delimiter):
+    # Returns the cache key for the output of read_file(), which depends on every step of the pipeline
+    return('%%%s:%s>=%s:%s' %(kind, grep or '', int(self.config['logsfrom'] or 0) if time_filter else '', delimiter or ''))
+
+  def __content_digest(self, filename, size, mtime, sample=None):
+    # Returns the BLAKE2 hash of the contents of a local file. With sample, only that many bytes from the start
+    # and the end of the file are hashed.
+    key = (filename, size, mtime, sample)
+    if key not in _content_digests:
+      digest = hashlib.blake2b(digest_size=16)
+      with self.__open_local(filename) as file:
+        if sample and size > 2 * sample:
+          digest.update(file.read(sample))
+          file.seek(size - sample)
+          digest.update(file.read(sample))
+        else:
+          for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+      _content_digests[key] = digest.hexdigest()
+    return(_content_digests[key])
+
+  def __content_name(self, filename, max_size=64 * 1024 * 1024, sample=65536):
+    # Returns the name under which the contents of a file are cached. Bundle files with the same contents as the
+    # file at the same path of another node share a name, so they are read, cached and parsed once for the whole
+    # cluster. Only files with the same size and the same first and last bytes are hashed in full. Files over
+    # max_size and members of compressed tar archives, which would have to be decompressed to be hashed, are
+    # never shared. Names are kept by path for the rest of the run.
+    if not filename.startswith('/'):
+      return(filename)
+    if filename in _content_names:
+      return(_content_names[filename])
+    name = filename
+    _content_names[filename] = name
+    if not self.is_using_local_logs():
+      return(name)
+    root = self.local_directory(directory_type='root')
+    relative = os.path.relpath(filename, root)
+    if relative.startswith('..') or os.sep not in relative:
+      return(name)
+    try:
+      member = self.__tar_member(filename)
+      size, mtime = self.__local_stat(filename)
+    except (IOError, OSError):
+      return(name)
+    if size > max_size or (member and member[2]):
+      return(name)
+
+    node, path = relative.split(os.sep, 1)
+    try:
+      if root not in _bundle_nodes:
+        _bundle_nodes[root] = sorted(next(self.walk(root), (None, [], []))[1])
+      for other in _bundle_nodes[root]:
+        if other == node:
+          continue
+        sibling = os.path.join(root, other, path)
+        try:
+          sibling_size, sibling_mtime = self.__local_stat(sibling)
+        except (IOError, OSError):
+          continue
+        if sibling_size != size or self.__content_digest(sibling, sibling_size, sibling_mtime, sample) != self.__content_digest(filename, size, mtime, sample):
+          continue
+        digest = self.__content_digest(filename, size, mtime)
+        if self.__content_digest(sibling, sibling_size, sibling_mtime) == digest:
+          name = '%%content:%s' %digest
+          self.debug("%s has the same contents as %s" %(filename, sibling), code.LOG_DEBUG)
+          break
+    except (IOError, OSError, tarfile.TarError) as e:
+      self.debug("Could not compare %s with other nodes: %s" %(filename, e), code.LOG_DEBUG)
+    _content_names[filename] = name
+    return(name)
+
+  def __cache_get(self, filename, filter_string=None, stream=False):
+    # Returns cached contents, or False. Streams get an iterator over the contents of a BoundedFileCache or a
+    # SharedFileCache, so large entries are decompressed or decoded one block at a time.
+    if filter_string != '%index':
+      filename = self.__content_name(filename)
+    if stream and isinstance(self.filecache, (BoundedFileCache, SharedFileCache)):
+      contents = self.filecache.iter(filename=filename, filter_string=filter_string)
+    else:
+      contents = self.filecache.get(filename=filename, filter_string=filter_string)
+    if self.__lookups is not None:
+      if filter_string != '%index':
+        self.__lookups.append(contents != False)
+    elif contents == False:
+      _cache_statistics.miss(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__)
+    else:
+      _cache_statistics.hit(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__)
+    return(contents)
+
+  def __iter_counted(self, filename, filter_string, lines, lookups, start):
+    # Yields the lines of a stream, recording it in the cache statistics as a single read like __counted_read()
+    # once it's exhausted
+    while True:
+      outer, self.__lookups = self.__lookups, lookups
+      try:
+        line = next(lines)
+      except StopIteration:
+        break
+      finally:
+        self.__lookups = outer
+      yield line
+    if any(lookups):
+      _cache_statistics.hit(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__)
+    else:
+      _cache_statistics.miss(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__, seconds=timer() - start)
+
+  def __counted_read(self, filename, filter_string, method, *args):
+    # Calls a reading method, recording it in the cache statistics as a single hit when any of the cache
+    # entries it looked up was found, or as a single miss along with the time it took. Log file indexes
+    # don't count.
+    start = timer()
+    self.__lookups = []
+    try:
+      output = method(*args)
+    finally:
+      lookups, self.__lookups = self.__lookups, None
+    if any(lookups):
+      _cache_statistics.hit(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__, contents=output)
+    else:
+      _cache_statistics.miss(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__, seconds=timer() - start, contents=output)
     return(output)
 
+  def __cache_put(self, filename, contents, filter_string=None):
+    # Stores contents in the file cache, recording them in the cache statistics
+    if filter_string != '%index':
+      filename = self.__content_name(filename)
+    self.filecache.put(filename=filename, contents=contents, filter_string=filter_string)
+    _cache_statistics.store(filename=filename, filter_string=filter_string, bugcheck=self.__class__.__name__, contents=contents)
+
+  def __cache_unlock(self, filename):
+    # Unlocks an entry of the file cache locked with __cache_lock()
+    self.filecache.unlock(filename=self.__content_name(filename))
+
+  def __cache_lock(self, filename):
+    # Locks an entry of the file cache under the name its contents are cached with, recording the time spent
+    # waiting for it
+    filename = self.__content_name(filename)
+    start = timer()
+    self.filecache.lock(filename=filename)
+    _cache_statistics.wait(filename=filename, filter_string=None, bugcheck=self.__class__.__name__, seconds=timer() - start)
+
+  def __cached_contents(self, filename, grep, raw_key, grep_key, stream=False):
+    # Returns the cached lines of a local file matching grep, or False, along with their cache key. Without
+    # grepped contents, raw contents read from the same offset, or from the start of the file, are grepped in
+    # memory instead of reading the file again. Lines before the offset are removed later by the timestamp and
+    # delimiter filters.
+    if grep:
+      output = self.__cache_get(filename, grep_key, stream)
+      if output != False:
+        return(output, grep_key)
+    for key in dict.fromkeys([raw_key, None]):
+      output = self.__cache_get(filename, key, stream)
+      if output != False:
+        break
+    if output == False or not grep:
+      return(output, key)
+
+    start = timer()
+    match = self.__line_matcher(grep).match
+    total = 0
+    grepped = []
+    for total, line in enumerate(output, 1):
+      if match(line):
+        grepped.append(line)
+    self.debug("%s lines removed (%s remaining) after grepping cached contents for %s in %.2f seconds" %(total-len(grepped), len(grepped), grep, timer() - start), code.LOG_DEBUG)
+    self.__cache_put(filename=filename, contents=grepped, filter_string=grep_key)
+    return(grepped, grep_key)
+
+  def __iter_cached(self, filename, filter_string, lines):
+    # Yields cached lines, pinning their entry in a BoundedFileCache while they are read so it isn't evicted
+    pinned = isinstance(self.filecache, BoundedFileCache)
+    filename = self.__content_name(filename)
+    if pinned:
+      self.filecache.lock(filename=filename, filter_string=filter_string)
+    try:
+      for line in lines:
+        yield line
+    finally:
+      if pinned:
+        self.filecache.unlock(filename=filename, filter_string=filter_string)
+
+  def __compression(self, filename, file=None):
+    # Returns the module used to decompress a local file according to its magic bytes, or None. The magic bytes
+    # are peeked from file when the caller already opened it, as opening a member of a compressed tar archive
+    # decompresses the archive up to it. Results are kept per path, size and modification time. Raises IOError
+    # for xz files when lzma isn't available, so they are skipped rather than read as text.
+    try:
+      key = (filename,) + tuple(self.__local_stat(filename))
+      if key in _compressions:
+        return(_compressions[key])
+      if file:
+        magic = file.peek(6)[:6]
+      else:
+        with self.__open_local(filename) as file:
+          magic = file.read(6)
+    except (IOError, OSError):
+      return(None)
+    compression = None
+    if magic.startswith(b'\x1f\x8b'):
+      compression = gzip
+    elif magic.startswith(b'BZh'):
+      compression = bz2
+    elif magic.startswith(b'\xfd7zXZ\x00'):
+      if not lzma:
+        self.debug("Can't decompress %s: lzma is not available" %filename, code.LOG_WARNING)
+        raise(IOError("lzma is not available to decompress %s" %filename))
+      compression = lzma
+    _compressions[key] = compression
+    return(compression)
+
+  def __iter_compressed_blocks(self, filename, compression, block_size=1024 * 1024, raw=None):
+    # Decompresses a local file as a stream, yielding newline aligned blocks of bytes. The file is opened
+    # unless the caller gives it already open as raw.
+    owned = raw is None
+    if owned:
+      raw = self.__open_local(filename)
+    try:
+      with compression.open(raw, 'rb') as file:
+        remainder = b''
+        while True:
+          data = file.read(block_size)
+          if not data:
+            break
+          data = remainder + data
+          end = data.rfind(b'\n') + 1
+          if end:
+            remainder = data[end:]
+            yield data[:end]
+          else:
+            remainder = data
+        if remainder:
+          yield remainder
+    finally:
+      if owned:
+        raw.close()
+
+  def __read_compressed_file(self, filename, compression, grep, raw=None):
+    # Returns the lines of a compressed local file matching grep without decompressing it to disk
+    start = timer()
+    match = self.__line_matcher(grep).match if grep else None
+    output = []
+    for block in self.__iter_compressed_blocks(filename, compression, raw=raw):
+      lines = block.decode('utf-8', 'replace').splitlines()
+      if match:
+        output.extend([line for line in lines if match(line)])
+      else:
+        output.extend(lines)
+    self.debug("Decompressing %s with %s took %.2f seconds (%s lines)" %(filename, compression.__name__, timer() - start, len(output)), code.LOG_DEBUG)
+    return(output)
+
+  def __grep_local_file(self, filename, offset, grep):
+    # Greps a local file from an offset by running a bytes regex over a memory map of the file, decoding only
+    # the lines around each match. Returns None if the regex can't be run on bytes.
+    matcher = self.__line_matcher(grep)
+    pattern = matcher.bytes_pattern()
+    if not pattern or self.__tar_member(filename):
+      return(None)
+    start_time = timer()
+    output = []
+    with open(filename, 'rb') as file:
+      size = os.fstat(file.fileno()).st_size
+      if size <= offset:
+        return(output)
+      mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        matches = 0
+        match = pattern.search(mapping, offset)
+        while match:
+          start = mapping.rfind(b'\n', offset, match.start()) + 1 or offset
+          end = mapping.find(b'\n', match.end())
+          if end < 0:
+            end = size
+          # Matched bytes may span or split lines differently than str.splitlines(), so lines are checked again
+          for line in mapping[start:end].decode('utf-8', 'replace').splitlines():
+            if matcher.match(line):
+              output.append(line)
+          matches += 1
+          if matches % 10000 == 0 and (end - offset) // matches < 256:
+            # Most lines match, so decoding everything at once is faster than going through each match
+            self.debug("Most lines match %s, decoding the rest of %s" %(grep, filename), code.LOG_JEDI)
+            for line in mapping[end+1:].decode('utf-8', 'replace').splitlines():
+              if matcher.match(line):
+                output.append(line)
+            break
+          match = pattern.search(mapping, end + 1)
+      finally:
+        mapping.close()
+    self.debug("Grepping %s for %s over bytes took %.2f seconds (literal: %s)" %(filename, grep, timer() - start_time, matcher.literal), code.LOG_DEBUG)
+    return(output)
+
+  def __grep_local_records(self, filename, offset, line_number, grep, block_size=16 * 1024 * 1024):
+    # Records version of __grep_local_file(). Returns the (byte_offset, line_number, line) records of the lines
+    # matching grep from an offset, where line_number is the number of the line at offset, or None if the regex
+    # can't be run on bytes or the file can't be mapped. Lines are numbered by counting the newlines between
+    # matches.
+    matcher = self.__line_matcher(grep)
+    pattern = matcher.bytes_pattern()
+    if not pattern or self.__tar_member(filename) or self.__compression(filename):
+      return(None)
+    start_time = timer()
+    output = []
+
+    def add_lines(position, line_number, data):
+      # Adds the records of the physical lines in data, returning the offset and number of the following line
+      for raw in data.split(b'\n'):
+        for line in raw.decode('utf-8', 'replace').splitlines():
+          if matcher.match(line):
+            output.append((position, line_number, line))
+        position += len(raw) + 1
+        line_number += 1
+      return(position, line_number)
+
+    with open(filename, 'rb') as file:
+      size = os.fstat(file.fileno()).st_size
+      if size <= offset:
+        return(output)
+      mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        matches = 0
+        counted = offset
+        match = pattern.search(mapping, offset)
+        while match:
+          start = mapping.rfind(b'\n', counted, match.start()) + 1 or counted
+          end = mapping.find(b'\n', match.end())
+          if end < 0:
+            end = size
+          while counted < start:
+            line_number += mapping[counted:min(start, counted + block_size)].count(b'\n')
+            counted = min(start, counted + block_size)
+          # Matched bytes may span several lines, so each of them is checked again
+          counted, line_number = add_lines(start, line_number, mapping[start:end])
+          matches += 1
+          if matches % 10000 == 0 and (end - offset) // matches < 256:
+            # Most lines match, so decoding everything at once is faster than going through each match
+            self.debug("Most lines match %s, decoding the rest of %s" %(grep, filename), code.LOG_JEDI)
+            if counted < size:
+              add_lines(counted, line_number, mapping[counted:])
+            break
+          match = pattern.search(mapping, end + 1)
+      finally:
+        mapping.close()
+    self.debug("Grepping records of %s for %s over bytes took %.2f seconds (literal: %s)" %(filename, grep, timer() - start_time, matcher.literal), code.LOG_DEBUG)
+    return(output)
+
+  def __iter_local_file(self, filename, grep, time_filter, delimiter=None):
+    # Yields the lines of a local file matching grep. Cached contents are reused, but nothing is cached
+    # as that would keep the whole file in memory.
+    try:
+      offset, raw_key, grep_key = self.__local_cache_keys(filename, grep, time_filter, delimiter)
+      matcher = self.__line_matcher(grep) if grep else None
+      cached, key = self.__cached_contents(filename, grep, raw_key, grep_key, stream=True)
+
+      if cached != False:
+        self.debug("Re-used cached contents for %s" %filename, code.LOG_DEBUG)
+        for line in self.__iter_cached(filename, key, cached):
+          yield line
+        return
+      with self.__open_local(filename) as file:
+        compression = self.__compression(filename, file)
+        if compression:
+          for block in self.__iter_compressed_blocks(filename, compression, raw=file):
+            for line in block.decode('utf-8', 'replace').splitlines():
+              if not matcher or matcher.match(line):
+                yield line
+        else:
+          file.seek(offset)
+          for chunk in file:
+            for line in chunk.decode('utf-8', 'replace').splitlines():
+              if not matcher or matcher.match(line):
+                yield line
+    except Exception as e:
+      self.debug("Could not read %s: %s" %(filename, e), code.LOG_DEBUG)
+
+  def __iter_physical_lines(self, filename, offset=0, block_size=1024 * 1024, line_number=None):
+    # Yields (byte_offset, line_number, line) for the raw lines of a local file, starting from an offset at the
+    # beginning of a line. Line numbers are counted from the start of the file, unless the caller gives the
+    # number of the line at offset of an uncompressed file. Offsets in compressed files refer to the
+    # decompressed contents.
+    with self.__open_local(filename) as raw:
+      compression = self.__compression(filename, raw)
+      file = compression.open(raw, 'rb') if compression else raw
+      try:
+        if line_number is None or compression:
+          line_number = 1
+          remaining = offset
+          while remaining > 0:
+            data = file.read(min(block_size, remaining))
+            if not data:
+              return
+            line_number += data.count(b'\n')
+            remaining -= len(data)
+        else:
+          file.seek(offset)
+        for line in file:
+          yield (offset, line_number, line)
+          offset += len(line)
+          line_number += 1
+      finally:
+        if compression:
+          file.close()
+
+  def __iter_local_records(self, filename, grep, time_filter, delimiter=None):
+    # Yields (byte_offset, line_number, line) records for the lines of a local file matching grep. Lines split by
+    # str.splitlines() within a physical line share its offset and number, so the record can always be found again
+    # by seeking to its offset.
+    # Reading starts from the offset found by the timestamp or delimiter seek, numbering lines from the file's
+    # index, and greps run over a memory map when they can.
+    try:
+      offset = self.__local_cache_keys(filename, grep, time_filter, delimiter)[0]
+      line_number = self.__line_number(filename, offset, indexed=time_filter and self.config['logsfrom']) if offset else 1
+      if grep:
+        records = self.__grep_local_records(filename, offset, line_number, grep)
+        if records is not None:
+          for record in records:
+            yield record
+          return
+      matcher = self.__line_matcher(grep) if grep else None
+      pattern = matcher.bytes_pattern() if matcher else None
+      for position, line_number, chunk in self.__iter_physical_lines(filename, offset, line_number=line_number):
+        if pattern and not pattern.search(chunk):
+          continue
+        for line in chunk.decode('utf-8', 'replace').splitlines():
+          if not matcher or matcher.match(line):
+            yield (position, line_number, line)
+    except Exception as e:
+      self.debug("Could not read %s: %s" %(filename, e), code.LOG_DEBUG)
+
+  def __iter_lines(self, filename, grep, time_filter, delimiter=None, records=False):
+    # Yields the lines of a file through the grep and timestamp filters. Local files are read from the last
+    # occurrence of the delimiter when it can be found, but lines before it still have to be removed.
+    if not self.is_using_local_logs():
+      lines = self.__iter_remote_file(filename, grep, time_filter)
+      if records:
+        lines = ((None, None, line) for line in lines)
+      return(lines)
+
+    if records:
+      lines = self.__iter_local_records(filename, grep, time_filter, delimiter)
+    else:
+      lines = self.__iter_local_file(filename, grep, time_filter, delimiter)
+    if time_filter:
+      lines = self.__iter_filter_logs(lines, filename=filename, records=records)
+    else:
+      self.debug("Skipping timestamp filtering for %s" %filename, code.LOG_DEBUG)
+    return(lines)
+
+  def __rotated_members(self, filename):
+    # Returns the files of a rotated log set from the oldest to the newest. The set is given by the name of the
+    # current log, whose rotated copies are numbered or dated and may be compressed, or by a glob in the last
+    # path component. Local files are ordered by the date of their first line, or by modification time if it
+    # can't be read or they are members of a compressed tar archive. Files on the node, and local files with
+    # the same date, are ordered by their rotation suffix: higher numbers and older dates first, and the current
+    # log last.
+    directory, name = os.path.split(filename)
+    if re.search(r'[*?[]', name):
+      is_member = lambda member: fnmatch.fnmatchcase(member, name)
+    else:
+      is_member = re.compile(r'^%s(\.\d+|-\d{8,})?(\.(gz|bz2|xz))?$' %re.escape(name)).match
+
+    if self.is_using_local_logs():
+      names = next(self.walk(directory), (None, [], []))[2]
+    else:
+      names = self.run_command("ls -1 '%s'" %directory).stdout or []
+
+    members = []
+    for member in [name for name in names if is_member(name)]:
+      path = os.path.join(directory, member)
+      rotation = re.search(r'(\.(\d+)|-(\d{8,}))(\.(gz|bz2|xz))?$', member)
+      if not rotation:
+        suffix = (1, '', 0)
+      elif rotation.group(2):
+        suffix = (0, '', -int(rotation.group(2)))
+      else:
+        suffix = (0, rotation.group(3), 0)
+      date = 0
+      if self.is_using_local_logs():
+        tar_member = self.__tar_member(path)
+        if not (tar_member and tar_member[2]):
+          date = self.__log_start(path)
+        if not date:
+          try:
+            date = self.__local_stat(path)[1]
+          except OSError as e:
+            self.debug("Could not stat %s: %s" %(path, e), code.LOG_DEBUG)
+      members.append((date or 0, suffix, member, path))
+
+    members.sort()
+    self.debug("Rotated log set %s: %s" %(filename, ', '.join([member[2] for member in members])), code.LOG_DEBUG)
+    return([member[3] for member in members])
+
+  def __log_start(self, filename):
+    # Returns the date of the first line of a local log file, or None if it can't be read. Dates are kept per
+    # path, size, modification time and assumed year, as rotated sets look them up more than once.
+    try:
+      timestamps = self.__log_timestamps()
+      key = (filename,) + tuple(self.__local_stat(filename)) + (timestamps.year,)
+      if key not in _log_starts:
+        with self.__open_local(filename) as raw:
+          compression = self.__compression(filename, raw)
+          file = compression.open(raw, 'rb') if compression else raw
+          try:
+            _log_starts[key] = self.__first_date(file, 0, timestamps)[0]
+          finally:
+            if compression:
+              file.close()
+      return(_log_starts[key])
+    except Exception as e:
+      self.debug("Could not read the first date of %s: %s" %(filename, e), code.LOG_DEBUG)
+      return(None)
+
+  def __iter_rotated_file(self, filename, force_time_filter=False, from_last=None, grep=None, records=False, newest_first=False):
+    # Yields the lines of a rotated log set. Files are read from the newest to the oldest until one starts
+    # before logsfrom or contains the delimiter, as the older ones would be filtered out entirely and are not
+    # opened. Files are filtered by date separately, and with records their lines are (filename, byte_offset,
+    # line_number, line).
+    selected = []
+    for member in reversed(self.__rotated_members(filename)):
+      delimiter, member_grep, time_filter = self.__read_file_options(member, force_time_filter, from_last, grep)
+      lines = None
+      found = False
+      if delimiter:
+        lines = list(self.__iter_lines(member, member_grep, time_filter, delimiter, records))
+        found = any([delimiter in (line[-1] if records else line) for line in lines])
+        if found:
+          lines = self.__after_last(lines, delimiter, member, records=records)
+      selected.append((member, member_grep, time_filter, lines))
+      if found or (time_filter and self.config['logsfrom'] and self.is_using_local_logs() and (self.__log_start(member) or self.config['logsfrom']) < self.config['logsfrom']):
+        self.debug("Skipping the files of %s older than %s" %(filename, member), code.LOG_DEBUG)
+        break
+
+    if not newest_first:
+      selected.reverse()
+    for member, member_grep, time_filter, lines in selected:
+      if lines is None:
+        lines = self.__iter_lines(member, member_grep, time_filter, records=records)
+      for line in lines:
+        yield ((member,) + line) if records else line
+
+  def __filter_log_chunk(self, filename, block, grep):
+    # Greps and filters by date a block of lines, given either as the start and end offsets of the block in a
+    # local file or as bytes. Lines before the first dated one depend on the date of the previous block, so
+    # they are returned apart from the rest, along with the last date found so the next block can be stitched
+    # to this one.
+    if isinstance(block, tuple):
+      with self.__open_local(filename) as file:
+        file.seek(block[0])
+        block = file.read(block[1] - block[0])
+    lines = block.decode('utf-8', 'replace').splitlines()
+    if grep:
+      match = self.__line_matcher(grep).match
+      lines = [line for line in lines if match(line)]
+    if not self.config['logsfrom']:
+      return([], lines, None)
+
+    timestamps = self.__log_timestamps()
+    parse = timestamps.parser(lines[:100])
+    first = None
+    for index, line in enumerate(lines):
+      if parse(line):
+        first = index
+        break
+    if first is None:
+      return([line for line in lines if line.strip()], [], None)
+    last = None
+    for line in reversed(lines):
+      last = parse(line)
+      if last:
+        break
+    leading = [line for line in lines[:first] if line.strip()]
+    return(leading, list(self.__iter_filter_logs(lines[first:], filename=filename, size=len(lines) - first)), last)
+
+  def __read_local_file_parallel(self, filename, offset, grep, time_filter):
+    # Greps and filters by date a large local file in blocks using a process pool. Uncompressed files are
+    # split in newline aligned chunks read by the workers, while compressed files are decompressed here and
+    # handed to the workers in batches. Returns the lines in order and whether they still need to be filtered
+    # by date, or None if the file is too small to be worth it or a process pool can't be used.
+    workers = self.config['workers']
+    member = self.__tar_member(filename)
+    if member and member[2]:
+      # Every worker would need to decompress the archive up to the file
+      return(None)
+    size = self.__local_stat(filename)[0]
+    compression = self.__compression(filename)
+    # Logs usually compress to less than a tenth of their size
+    threshold = self.config['parallel_read_size'] // 10 if compression else self.config['parallel_read_size']
+    if workers < 2 or size - offset < threshold:
+      return(None)
+    if multiprocessing.current_process().daemon:
+      self.debug("Not reading %s in parallel from a daemon process" %filename, code.LOG_JEDI)
+      return(None)
+
+    logsfrom = self.config['logsfrom'] if time_filter else None
+    chunk_size = max(16 * 1024 * 1024, (size - offset) // (workers * 4) + 1)
+    if compression:
+      blocks = self.__iter_compressed_blocks(filename, compression, block_size=16 * 1024 * 1024)
+    else:
+      boundaries = [offset]
+      with self.__open_local(filename) as file:
+        while boundaries[-1] + chunk_size < size:
+          file.seek(boundaries[-1] + chunk_size)
+          file.readline()
+          if file.tell() >= size:
+            break
+          boundaries.append(file.tell())
+      boundaries.append(size)
+      blocks = iter([(boundaries[i], boundaries[i+1]) for i in range(len(boundaries) - 1)])
+
+    start = timer()
+    self.debug("Reading %s in blocks using %s processes" %(filename, workers), code.LOG_DEBUG)
+    results = []
+    try:
+      pool = multiprocessing.Pool(workers)
+      try:
+        # Blocks are sent in batches so decompressed data doesn't pile up waiting for the workers
+        batch = list(itertools.islice(blocks, workers * 2))
+        while batch:
+          results.extend(pool.map(_filter_log_chunk, [(filename, block, grep, logsfrom) for block in batch]))
+          batch = list(itertools.islice(blocks, workers * 2))
+      finally:
+        pool.close()
+        pool.join()
+    except Exception as e:
+      self.debug("Could not read %s in parallel: %s" %(filename, e), code.LOG_DEBUG)
+      return(None)
+
+    output = []
+    linedate = None
+    for leading, lines, last in results:
+      # Lines at the start of a block take the last date of the previous blocks
+      if linedate and linedate >= logsfrom:
+        output.extend(leading)
+      output.extend(lines)
+      if last:
+        linedate = last
+    self.debug("Reading %s in %s blocks took %.2f seconds (%s lines)" %(filename, len(results), timer() - start, len(output)), code.LOG_DEBUG)
+    return(output, time_filter and not logsfrom)
+
+  def __remote_date_filter(self):
+    # Returns a gawk program that filters log lines by date on the node being checked. It reads the same
+    # date formats as __log_timestamps and keeps undated lines when the previous date was in range. mktime()
+    # is a gawk extension, so the command fails where gawk isn't installed instead of running another awk.
+    program = [
+      'BEGIN {',
+      '  split("jan feb mar apr may jun jul aug sep oct nov dec", names, " ")',
+      '  for (i = 1; i <= 12; i++) months[names[i]] = i',
+      '}',
+      '{',
+      '  date = -1',
+      '  if ($1 ~ /^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]/ && $2 ~ /^[0-9][0-9]:[0-9][0-9]:[0-9][0-9]/)',
+      '    date = mktime(substr($1, 1, 4) " " substr($1, 6, 2) " " substr($1, 9, 2) " " substr($2, 1, 2) " " substr($2, 4, 2) " " substr($2, 7, 2))',
+      '  else if (tolower($1) in months && $2 ~ /^[0-9][0-9]/ && $3 ~ /^[0-9][0-9]:[0-9][0-9]:[0-9][0-9]/)',
+      '    date = mktime(year " " months[tolower($1)] " " substr($2, 1, 2) " " substr($3, 1, 2) " " substr($3, 4, 2) " " substr($3, 7, 2))',
+      '  else if ($1 ~ /^[A-Z][0-9][0-9][0-9][0-9]/ && $2 ~ /^[0-9][0-9]:[0-9][0-9]:[0-9][0-9]/)',
+      '    date = mktime(year " " substr($1, 2, 2) " " substr($1, 4, 2) " " substr($2, 1, 2) " " substr($2, 4, 2) " " substr($2, 7, 2))',
+      '  if (date > 0) linedate = date',
+      '  if (NF && linedate && linedate >= logsfrom) print',
+      '}',
+    ]
+    command = "gawk -v logsfrom=%s -v year=%s '%s'" %(int(self.config['logsfrom']), self.__log_timestamps().year, '\n'.join(program))
+    return(command)
+
+  def __remote_decompressor(self, filename):
+    # Returns the command used to decompress a file on the node being checked, or None if it isn't compressed
+    decompressors = {'gz': 'zcat', 'bz2': 'bzcat', 'xz': 'xzcat'}
+    return(decompressors.get(filename.split('.')[-1]))
+
+  def __remote_grep(self, filename, grep, pipefail=False):
+    # Returns the command used to grep a file on the node being checked. Lines are first selected with grep -F
+    # using the literal required by the regex, and literal greps don't need egrep at all. With pipefail, greps
+    # not matching any line still succeed so only real errors fail a pipeline run with set -o pipefail.
+    matcher = self.__line_matcher(grep)
+    literal = matcher.shell_literal()
+    if literal and matcher.is_literal:
+      commands = ['grep -F -e \'%s\'' %literal]
+    elif literal:
+      commands = ['grep -F -e \'%s\'' %literal, 'egrep \'%s\'' %grep]
+    else:
+      commands = ['egrep \'%s\'' %grep]
+    decompressor = self.__remote_decompressor(filename)
+    if not decompressor:
+      commands[0] = '%s %s' %(commands[0], filename)
+    if pipefail:
+      commands = ['{ %s || [ $? -eq 1 ]; }' %command for command in commands]
+    if decompressor:
+      commands.insert(0, '%s %s' %(decompressor, filename))
+    return(' | '.join(commands))
+
+  def __read_remote_file(self, filename, grep, time_filter=False):
+    # Reads a file from the node being checked. When the file has to be filtered by date this is done on the
+    # node so only the lines in range are transferred, with pipefail so a failing grep or decompressor isn't
+    # hidden by the filter. Returns the lines and whether they still need to be filtered by date.
+    if time_filter and self.config['logsfrom']:
+      filter_string = '%s@%s' %(grep or '', int(self.config['logsfrom']))
+      output = self.__cache_get(filename=filename, filter_string=filter_string)
+      if output == False:
+        if grep:
+          command = '%s | %s' %(self.__remote_grep(filename, grep, pipefail=True), self.__remote_date_filter())
+        else:
+          command = '%s %s' %(self.__remote_date_filter(), filename)
+          if self.__remote_decompressor(filename):
+            command = '%s %s | %s' %(self.__remote_decompressor(filename), filename, self.__remote_date_filter())
+        result = self.run_command('set -o pipefail; %s' %command)
+        if result.exit_code == code.OK:
+          output = result.stdout
+          self.__cache_put(filename=filename, filter_string=filter_string, contents=output)
+        else:
+          self.debug("Could not filter %s by date on the node: %s" %(filename, result.stderr), code.LOG_DEBUG)
+      else:
+        self.debug("Re-used cached contents for %s" %filename, code.LOG_DEBUG)
+      if output != False:
+        self.debug("Filtered %s by date on the node" %filename, code.LOG_DEBUG)
+        return(output, False)
+
+    output = self.__cache_get(filename=filename, filter_string=grep)
+    if output == False:
+      if grep:
+        output = self.run_command(self.__remote_grep(filename, grep)).stdout
+      else:
+        output = self.run_command('%s %s' %(self.__remote_decompressor(filename) or 'cat', filename)).stdout
+      self.__cache_put(filename=filename, filter_string=grep, contents=output)
+    else:
+      self.debug("Re-used cached contents for %s" %filename, code.LOG_DEBUG)
+    return(output, time_filter)
+
+  def __iter_remote_file(self, filename, grep, time_filter):
+    # Yields the lines of a file from the node being checked, filtered by date if needed
+    try:
+      output, time_filter = self.__read_remote_file(filename, grep, time_filter)
+    except Exception as e:
+      self.debug("Could not read %s: %s" %(filename, e), code.LOG_DEBUG)
+      return
+    if time_filter:
+      output = self.__iter_filter_logs(output, filename=filename, size=len(output))
+    for line in output:
+      yield line
+
+  def __after_last(self, lines, delimiter, filename, records=False):
+    # Returns the lines after the last one containing the delimiter, or all of them if it isn't found
+    self.debug("Found delimiter for %s: %s" %(filename, delimiter), code.LOG_DEBUG)
+    for index in range(len(lines) - 1, -1, -1):
+      if delimiter in (lines[index][-1] if records else lines[index]):
+        self.debug("Delimiter string \"%s\" found with index %s" %(delimiter, index), code.LOG_DEBUG)
+        return(lines[index+1:])
+    self.debug("Couldn't find any occurrences of %s." %delimiter, code.LOG_DEBUG)
+    return(lines)
+
+  def __iter_after_last(self, lines, delimiter, filename, records=False):
+    # Streaming version of __after_last(). Lines are held back until the end of the input is reached, as a
+    # later delimiter would discard them.
+    self.debug("Found delimiter for %s: %s" %(filename, delimiter), code.LOG_DEBUG)
+    tail = []
+    found = False
+    for line in lines:
+      if delimiter in (line[-1] if records else line):
+        found = True
+        tail = []
+      else:
+        tail.append(line)
+    if not found:
+      self.debug("Couldn't find any occurrences of %s." %delimiter, code.LOG_DEBUG)
+    for line in tail:
+      yield line
+
+  def __matches_key(self, regex):
+    # Returns the cache key for the matches of a regex. Matches depend on how the file contents were filtered.
+    return('#%s@%s:%s' %(regex, int(self.config['logsfrom'] or 0), int(bool(self.config['read_files_only_from_last_service_restart']))))
+
+  def __scan_matches(self, filename, regexes):
+    # Reads a file once and returns a dictionary with the (byte_offset, line_number, line) records matching each
+    # regex. Lines are first tested against all the regexes combined so only matching lines are tested separately.
+    # Files read from the node have no offsets, and are numbered by their position in the filtered contents.
+    start = timer()
+    regexes = list(dict.fromkeys(regexes))
+    matchers = [self.__line_matcher(regex) for regex in regexes]
+    try:
+      combined = re.compile('|'.join(['(?:%s)' %regex for regex in regexes]))
+    except re.error as e:
+      # Back references and named groups can't always be combined
+      self.debug("Could not combine regexes for %s: %s" %(filename, e), code.LOG_JEDI)
+      combined = None
+    matches = dict([(regex, []) for regex in regexes])
+
+    # Local files are grepped for the combined regexes over a memory map. Files read from the node aren't, as
+    # their lines are numbered by position, and neither are files read from a delimiter, whose line is added to
+    # the regex.
+    grep = None
+    if combined and self.is_using_local_logs() and not self.__read_file_options(filename)[0]:
+      grep = combined.pattern
+    count = 0
+    for count, (offset, line_number, line) in enumerate(self.iter_file(filename, records=True, grep=grep), 1):
+      if combined and not combined.search(line):
+        continue
+      for regex, matcher in zip(regexes, matchers):
+        if matcher.match(line):
+          matches[regex].append((offset, line_number or count, line))
+
+    self.debug("Scanned %s lines of %s for %s regexes in %.2f seconds" %(count, filename, len(regexes), timer() - start), code.LOG_DEBUG)
+    return(matches)
+
+  def __diagnostic_pointer(self, entry):
+    # Returns the "filename:line_number@byte_offset" pointer for a (filename, record) diagnostic file entry, or
+    # a record of a rotated log set, which includes the file name. Other entries are stored as they are.
+    if not isinstance(entry, tuple):
+      return(entry)
+    if len(entry) == 4:
+      filename, offset, line_number, _ = entry
+    else:
+      filename, (offset, line_number, _) = entry
+    if offset is None:
+      return(filename if line_number is None else '%s:%s' %(filename, line_number))
+    return('%s:%s@%s' %(filename, line_number, offset))
+
   def __filter_k8s_elements(self, elements, filter):
     # Filters elements obtained using the __read_k8s_describe method. Currently filtering is only implemented for pods.
     resources = {}
@@ -461,8 +3120,8 @@ class Bug(object):
     stderr = None
     try:
       output = subprocess.run(command, shell=True, capture_output=True)
-      stdout = output.stdout.splitlines()
-      stderr = output.stderr.splitlines()
+      stdout = Lines.split(output.stdout, errors=None)
+      stderr = Lines.split(output.stderr, errors=None)
       exit_code = output.returncode
     except AttributeError:
       self.debug("Falling back to compatibility mode", code.LOG_DEBUG)
@@ -570,23 +3229,44 @@ class Bug(object):
 
     return(result.stdout)
 
+  def clean_cache(self, max_bytes=0):
+    """ Removes the data kept across runs in the cache directory, such as log file indexes,
+    read_file() results, command outputs and scan() statuses, starting with the least recently used,
+    until it takes no more than max_bytes.
+
+    Args:
+        max_bytes (int): Size in bytes to leave in the cache directory. Default: 0
+
+    Returns:
+        int: Number of bytes removed
+    """
+    return(self.__trim_cache(['index', 'results', 'commands', 'scans'], max_bytes))
+
   def configure(
     self,
     filecache=None,
     bootstrap=False,
+    cache_directory=None,
+    cache_memory_limit=None,
+    cache_statistics_file=None,
     cluster_store=None,
     connection=None,
     debug_level=None,
     debugcmddir=None,
     debuglogdir=None,
     description=None,
+    fingerprint_scans=None,
     logsfrom=None,
     log_to_file=False,
     metadata_json=None,
     name=None,
+    no_cache=None,
     node_config=None,
+    parallel_read_size=None,
     read_files_only_from_last_service_restart=None,
-    timeout=None
+    results_cache_size=None,
+    timeout=None,
+    workers=None
   ):
     """ Set the bug class properties
 
@@ -595,16 +3275,32 @@ class Bug(object):
         metadata_json (str): JSON file containing bugcheck metadata
         bootstrap (bool): Whether or not we're doing initial configuration of the module. Setting to True
             will cause version compatibility validation to be skipped.
+        cache_directory (str): Directory used to keep data across runs, such as log file indexes. Data is
+            only kept when it or results_cache_size are set. Default: ~/.cache/bugchecks
+        cache_memory_limit (int): Memory budget in bytes of the file cache, when it's a BoundedFileCache.
+        cache_statistics_file (str): JSON file where the file cache use of all the bugchecks, by key and
+            by bugcheck, is written when the run ends
         connection (paramiko.client.SSHClient object): SSH connection to use when running remote commands
         debug_level (int): Debugging messages level
         debugcmddir (str): Path to the cvpi_commands directory extracted from cvpi_debug_all file
         debuglogdir (str): Path to the cvpi_logs directory extracted from the cvpi_debug_all file
         description (str): Bugcheck description. Will be overwritten by metadata if one is provided
+        fingerprint_scans (bool): Restore the status of the last scan() run when the files and command outputs
+            it read are unchanged, for all the bugchecks but the ones setting scan.fingerprint to false in
+            their metadata. Bugchecks can also opt in with scan.fingerprint set to true. Statuses are only kept
+            when the cache directory is configured. Default: False
         logsfrom (int): Unix timestamp of the starting date to use when filtering log files
         name (str): Name of the bugcheck. Will be overwritten by metadata if one is provided
+        no_cache (bool): Ignore the read_file() results, command outputs and scan() statuses kept across runs.
+            They are still refreshed. Default: False
         node_config (dict): Dictionary containing the node's configuration
+        parallel_read_size (int): Size in bytes from which local files are read using several processes.
+            Default: 256MB
         read_files_only_from_last_service_restart (bool): Only return file contents generated after the last
             service restart if possible. Default: False
+        results_cache_size (int): Size limit in bytes of the data kept in the cache directory across runs.
+            0 disables it. Default: 1GB if cache_directory is set, otherwise nothing is kept
+        workers (int): Number of processes used to read large files. Default: number of CPUs
     """
     file = None
     metadata = {}
@@ -622,6 +3318,14 @@ class Bug(object):
       self.config['read_files_only_from_last_service_restart'] = read_files_only_from_last_service_restart
     elif not self.config.get('read_files_only_from_last_service_restart'):
       self.config['read_files_only_from_last_service_restart'] = False
+    if no_cache != None:
+      self.config['no_cache'] = no_cache
+    elif not self.config.get('no_cache'):
+      self.config['no_cache'] = False
+    if fingerprint_scans != None:
+      self.config['fingerprint_scans'] = fingerprint_scans
+    elif not self.config.get('fingerprint_scans'):
+      self.config['fingerprint_scans'] = False
     
     bug_json = os.path.dirname(os.path.realpath(__file__)) + '/bug.json'
     file = open(bug_json, 'r')
@@ -660,8 +3364,20 @@ class Bug(object):
     if cluster_store is not None:
       self.cluster_store = cluster_store
 
+    if cache_directory:
+      self.config['cache_directory'] = cache_directory
+    elif not self.config.get('cache_directory'):
+      self.config['cache_directory'] = None
+
     if filecache:
         self.filecache=filecache
+    if cache_memory_limit:
+      if isinstance(getattr(self, 'filecache', None), BoundedFileCache):
+        self.filecache.max_bytes = cache_memory_limit
+      else:
+        self.debug("The file cache has no memory budget. Ignoring cache_memory_limit.", code.LOG_DEBUG)
+    if cache_statistics_file:
+      _cache_statistics.dump_at_exit(cache_statistics_file)
 
     # Directories used when reading logs
     if debugcmddir:
@@ -679,6 +3395,21 @@ class Bug(object):
     elif not self.config.get('logsfrom'):
       self.config['logsfrom'] = None
 
+    # Parallel reading of large files
+    if workers:
+      self.config['workers'] = workers
+    elif not self.config.get('workers'):
+      self.config['workers'] = multiprocessing.cpu_count()
+    if parallel_read_size:
+      self.config['parallel_read_size'] = parallel_read_size
+    elif not self.config.get('parallel_read_size'):
+      self.config['parallel_read_size'] = 256 * 1024 * 1024
+
+    if results_cache_size is not None:
+      self.config['results_cache_size'] = results_cache_size
+    elif 'results_cache_size' not in self.config:
+      self.config['results_cache_size'] = None
+
     # Node configuration
     if node_config:
       self.config['node_config'] = node_config
@@ -708,6 +3439,9 @@ class Bug(object):
 
     self.debug("%s: %s" % (self.config['name'], str(self.config)), code.LOG_JEDI)
 
+    for subscribed_file, regex in self.get_subscriptions():
+      _subscriptions.setdefault(subscribed_file, {})[regex] = None
+
   def cvp_is(self, compare, version):
     """ Compare if a provided version is newer, newer or equal, older, older or equal than or equal to the node's CVP version.
 
@@ -896,6 +3630,15 @@ class Bug(object):
 
     return(results)
 
+  def get_cache_statistics(self):
+    """ Returns the file cache use of all the bugchecks run by this process
+
+    Returns:
+        dict: Hits, misses, bytes stored, served and evicted, lock wait time and estimated time saved, in
+            total, by cache key and by bugcheck.
+    """
+    return(_cache_statistics.get_stats())
+
   def get_cluster_mode(self):
     """ Returns the mode of the CVP cluster.
 
@@ -921,6 +3664,9 @@ class Bug(object):
     r = {}
     r = self.config.copy()
     r['status'] = self.status.copy()
+    if isinstance(getattr(self, 'filecache', None), (BoundedFileCache, SharedFileCache)):
+      r['filecache'] = self.filecache.get_stats()
+    r['cache_statistics'] = _cache_statistics.get_stats(bugcheck=self.__class__.__name__)
 
     for key in exclude_keys:
       if r.get(key):
@@ -963,8 +3709,15 @@ class Bug(object):
         self.debug("Cannot read k8s type %s from local logs" %resource_type, code.LOG_DEBUG)
         raise(TypeError)
       else:
-        elements = self.read_file(self.local_directory(directory_type='commands')+'/kube_pod')
-        elements = self.__read_k8s_describe(elements, resource_type)
+        kube_pod = self.local_directory(directory_type='commands')+'/kube_pod'
+        # Parsed contents are cached, and shared by the nodes with the same kube_pod output. kube_pod is an input
+        # of the running scan() even when it isn't read.
+        self.__record_input('file', kube_pod)
+        elements = self.__cache_get(filename=kube_pod, filter_string='%%k8s:%s' %resource_type)
+        if elements == False:
+          elements = self.__read_k8s_describe(self.read_file(kube_pod), resource_type)
+          self.__cache_put(filename=kube_pod, contents=elements, filter_string='%%k8s:%s' %resource_type)
+        elements = copy.deepcopy(elements)
     else:
       elements = self.run_command("kubectl describe %s" %resource_type).stdout
       if elements:
@@ -979,6 +3732,41 @@ class Bug(object):
 
     return(resources)
 
+  def get_matches(self, filename, regex, records=False):
+    """ Returns the lines of a file matching a regex along with their line numbers. Files are
+    read as in iter_file(), so log files are filtered by date, but line numbers refer to the
+    file as it is on disk. Line numbers of files read from the node refer to the position in
+    the filtered contents.
+
+    The first call for a file scans it once for the regex and the subscriptions declared in the
+    metadata of all the configured bugchecks, caching the matches of each, so later calls for
+    subscribed regexes don't read the file again. Other regexes cause the file to be read again.
+
+    Args:
+        filename (str): Path to the file
+        regex (str): Regex to search for
+        records (bool): Return (byte_offset, line_number, line) records as in read_file(). Default: False
+
+    Returns:
+        list: (line_number, line) tuples
+    """
+    if self.__inputs is not None:
+      self.__record_input('file', filename)
+      return(self.__unrecorded(self.get_matches, filename, regex, records))
+    if self.__lookups is None:
+      return(self.__counted_read(filename, self.__matches_key(regex), self.get_matches, filename, regex, records))
+    matches = self.__cache_get(filename=filename, filter_string=self.__matches_key(regex))
+    if matches == False:
+      regexes = [regex] + list(_subscriptions.get(filename, {}))
+      self.debug("No cached matches for %s in %s. Scanning it for %s regexes." %(regex, filename, len(set(regexes))), code.LOG_DEBUG)
+      scanned = self.__scan_matches(filename, regexes)
+      for scanned_regex in scanned:
+        self.__cache_put(filename=filename, contents=scanned[scanned_regex], filter_string=self.__matches_key(scanned_regex))
+      matches = scanned[regex]
+    if not records:
+      matches = [(line_number, line) for _, line_number, line in matches]
+    return(matches)
+
   def get_node_name(self):
     """ Returns the name of the current node.
 
@@ -1005,6 +3793,29 @@ class Bug(object):
     else:
       return(self.status)
 
+  def get_subscriptions(self):
+    """ Returns the files and regexes the bugcheck subscribes to. These are declared in the
+    metadata as a list of dictionaries with a directory type, as used in local_directory(),
+    a file name and a regex:
+
+      "scan": {
+        "subscriptions": [
+          {"directory": "commands", "file": "journalctl", "regex": "DeadlineExceeded"}
+        ]
+      }
+
+    Subscriptions only apply when reading log files.
+
+    Returns:
+        list: (filename, regex) tuples
+    """
+    subscriptions = []
+    if self.is_using_local_logs() and self.config.get('scan'):
+      for subscription in self.config['scan'].get('subscriptions', []):
+        filename = self.local_directory(directory_type=subscription['directory']) + '/' + subscription['file']
+        subscriptions.append((filename, subscription['regex']))
+    return(subscriptions)
+
   def is_current_node(self):
     """ Returns whether or not we're looking at the host we're currently running on.
 
@@ -1036,6 +3847,59 @@ class Bug(object):
       self.debug("False", code.LOG_JEDI)
       return(False)
 
+  def iter_file(self, filename, force_time_filter=False, from_last=None, grep=None, records=False, rotated=False, newest_first=False):
+    """ Streaming version of read_file(). Lines are yielded one at a time as they go through
+    the grep, timestamp and from_last filters, so memory use doesn't depend on the size of the
+    file. Bugchecks that only loop over the lines of a file can use this instead of read_file().
+
+    Contents that are already cached are reused, but streamed contents are not cached. When
+    from_last is used lines are held until the end of the file is reached, as a later delimiter
+    would discard them.
+
+    Args:
+        filename (str): Path to the file
+        force_time_filter (bool): Force running the file's contents through the timestamp filtering function
+            even if the file is not considered a log file. Default: False
+        from_last (str): Return only the contents after the last occurrence of STRING.
+        grep (str): Return only lines matching this regex.
+        records (bool): Yield (byte_offset, line_number, line) records. See read_file(). Default: False
+        rotated (bool): Read a rotated log set. See read_file(). Default: False
+        newest_first (bool): Read the files of a rotated log set from the newest to the oldest. Default: False
+
+    Returns:
+        generator: File lines
+    """
+    if self.__inputs is not None:
+      self.__record_input('rotated' if rotated else 'file', filename)
+      return(self.__iter_unrecorded(self.__unrecorded(self.iter_file, filename, force_time_filter, from_last, grep, records, rotated, newest_first)))
+    if self.__lookups is None:
+      delimiter, regex, time_filter = self.__read_file_options(filename, force_time_filter, from_last, grep)
+      result_key = self.__result_key('records' if records else 'result', regex, time_filter, delimiter)
+      if rotated:
+        result_key = '%%rotated:%s' %result_key
+      start, self.__lookups = timer(), []
+      try:
+        lines = self.iter_file(filename, force_time_filter, from_last, grep, records, rotated, newest_first)
+      finally:
+        lookups, self.__lookups = self.__lookups, None
+      return(self.__iter_counted(filename, result_key, lines, lookups, start))
+    if rotated:
+      return(self.__iter_rotated_file(filename, force_time_filter, from_last, grep, records, newest_first))
+
+    delimiter, grep, time_filter = self.__read_file_options(filename, force_time_filter, from_last, grep)
+    if self.is_using_local_logs():
+      result_key = self.__result_key('records' if records else 'result', grep, time_filter, delimiter)
+      cached = self.__cache_get(filename, result_key, stream=True)
+      if cached != False:
+        self.debug("Re-used cached results for %s" %filename, code.LOG_DEBUG)
+        return(self.__iter_cached(filename, result_key, cached))
+    lines = self.__iter_lines(filename, grep, time_filter, delimiter, records)
+
+    if delimiter:
+      lines = self.__iter_after_last(lines, delimiter, filename, records=records)
+
+    return(lines)
+
   def local_command_output_directory(self):
     """ When using log files return the local command outputs directory. This should
     be used when reading files from cvpi_debug_all logs, and will refer to the
@@ -1205,7 +4069,33 @@ class Bug(object):
 
     return([True, None])
 
-  def read_file(self, filename, force_time_filter=False, from_last=None, grep=None):
+  def prefetch_subscriptions(self, bugchecks):
+    """ Scans each file the bugchecks subscribe to only once, testing its lines against all the
+    subscribed regexes combined, and caches the matches of each regex so get_matches() returns
+    them without reading the file again. get_matches() already does this for the subscriptions of
+    the configured bugchecks the first time a file is read. This scans the files in advance, such
+    as before the bugchecks sharing the file cache are scanned in parallel.
+
+    Args:
+        bugchecks (list): Configured bugcheck objects
+    """
+    files = {}
+    for bugcheck in bugchecks:
+      for filename, regex in bugcheck.get_subscriptions():
+        if self.__cache_get(filename=filename, filter_string=self.__matches_key(regex)) == False:
+          files.setdefault(filename, []).append(regex)
+
+    for filename in files:
+      self.debug("Prefetching %s regexes for %s" %(len(files[filename]), filename), code.LOG_DEBUG)
+      try:
+        matches = self.__scan_matches(filename, files[filename])
+      except Exception as e:
+        self.debug("Could not prefetch matches for %s: %s" %(filename, e), code.LOG_DEBUG)
+        continue
+      for regex in matches:
+        self.__cache_put(filename=filename, contents=matches[regex], filter_string=self.__matches_key(regex))
+
+  def read_file(self, filename, force_time_filter=False, from_last=None, grep=None, stream=False, records=False, rotated=False, newest_first=False):
     """ Retrives a file's content. It will also perform filtering according to the
     timestamp if a log start date has been previously set and the filename
     matches a list of expected log filename patterns.
@@ -1222,110 +4112,188 @@ class Bug(object):
       - kubelet_journalctl
       - coredns
 
+    Lines can also be returned as (byte_offset, line_number, line) records. Offsets and line
+    numbers refer to the file as it is on disk, whatever was removed by grep, timestamp or
+    from_last filtering, and can be given to set_status() as diagnostic files. They are None
+    for files read from the node being checked.
+
+    Logs rotated into several files (*.log, *.log.1, *.log.2.gz...) can be read as a set by
+    giving the name of the current log, or a glob matching the files, with rotated=True. Local
+    files are ordered by the date of their first line, falling back to their modification time,
+    and files on the node by their rotation number or date suffix. Older files are not read once
+    one starts before the log start date or contains the from_last delimiter. Records of rotated sets are
+    (filename, byte_offset, line_number, line) tuples.
+
     Args:
         filename (str): Path to the file
         force_time_filter (bool): Force running the file's contents through the timestamp filtering function
             even if the file is not considered a log file. Default: False
         from_last (str): Return only the contents after the last occurrence of STRING.
         grep (str): Return only lines matching this regex.
+        stream (bool): Return a generator instead of a list. See iter_file(). Default: False
+        records (bool): Return (byte_offset, line_number, line) records instead of lines. Default: False
+        rotated (bool): Read a rotated log set. filename is the name of the current log or a glob. Default: False
+        newest_first (bool): Read the files of a rotated log set from the newest to the oldest. Default: False
 
     Returns:
-        list: File lines
+        list: File lines. Results of Lines.min_lines lines or more are a Lines, a read only list
     """
-    class log_delimiter(object):
-      def __init__(self, bug):
-        self.logfile = {}
-        self.logfile[bug.local_directory(directory_type='logs')+'/hbasemaster'] = 'server.Server: Started'
-        self.logfile[bug.local_directory(directory_type='logs')+'/elasticsearch-server/es-cluster.log'] = '] started'
-        self.logfile[bug.local_directory(directory_type='logs')+'/aaa/aaa.stderr.log'] = 'Initializing auth providers map'
-        self.logfile[bug.local_directory(directory_type='logs')+'/user/user-upgrade.log'] = 'Upgrading user component'
-
-      def get_delimiter(self, logfile):
-        delimiter = None
-        for definition in self.logfile.keys():
-          if definition in logfile:
-            delimiter = self.logfile[definition]
-        return(delimiter)
+    if stream or rotated:
+      lines = self.iter_file(filename, force_time_filter=force_time_filter, from_last=from_last, grep=grep, records=records, rotated=rotated, newest_first=newest_first)
+      return(lines if stream else list(lines))
+    if self.__inputs is not None:
+      self.__record_input('file', filename)
+      return(self.__unrecorded(self.read_file, filename, force_time_filter, from_last, grep, stream, records))
 
-    delimiter = None
-    log_suffixes = ['log', 'out', 'journalctl', 'kubelet_journalctl', 'coredns']
+    if self.__lookups is None:
+      delimiter, regex, time_filter = self.__read_file_options(filename, force_time_filter, from_last, grep)
+      result_key = self.__result_key('records' if records else 'result', regex, time_filter, delimiter)
+      return(self.__counted_read(filename, result_key, self.read_file, filename, force_time_filter, from_last, grep, stream, records))
 
-    if self.config['read_files_only_from_last_service_restart']:
-      if from_last:
-        delimiter = from_last
-      else:
-        delimiter = log_delimiter(self)
-        delimiter = delimiter.get_delimiter(filename)
-      if not delimiter:
-        self.debug("No delimiter found for %s" %filename , code.LOG_DEBUG)
-    else:
-      self.debug("Bypassing service last restart filtering", code.LOG_DEBUG)
+    delimiter, grep, time_filter = self.__read_file_options(filename, force_time_filter, from_last, grep)
 
-    if delimiter and grep:
-      if grep.startswith('(') and (grep.endswith(')') and not grep.endswith(r'\)')):
-        grep = grep.split('(')[1].split(')')[0].split('|')
+    if records:
+      if not self.is_using_local_logs():
+        return(list(self.iter_file(filename, force_time_filter=force_time_filter, from_last=from_last, grep=grep, records=True)))
+      records_key = self.__result_key('records', grep, time_filter, delimiter)
+      output = self.__cache_get(filename=filename, filter_string=records_key)
+      if output == False:
+        output = list(self.iter_file(filename, force_time_filter=force_time_filter, from_last=from_last, grep=grep, records=True))
+        self.__cache_put(filename=filename, contents=output, filter_string=records_key)
       else:
-        grep = [grep]
-      grep.append(delimiter)
-      grep = '|'.join(grep)
-      grep = '(%s)' %grep
-      self.debug("Formatted regex search: %s" %grep, code.LOG_JEDI)
+        self.debug("Re-used cached records for %s" %filename, code.LOG_DEBUG)
+      return(output)
 
+    result_key = None
+    persistent = False
+    # time_filter is cleared once contents come out of the reader already filtered by date
+    filtered = time_filter
     try:
       if self.is_using_local_logs():
-        if grep:
-          output = self.filecache.get(filename=filename, filter_string=grep)
-        else:
-          output = self.filecache.get(filename=filename)
-
+        result_key = self.__result_key('result', grep, time_filter, delimiter)
+        output = self.__cache_get(filename=filename, filter_string=result_key)
+        if output != False:
+          self.debug("Re-used cached results for %s" %filename, code.LOG_DEBUG)
+          return(output)
+        persistent = grep or time_filter or delimiter
+        if persistent:
+          output = self.__load_results(filename, result_key)
+          if output is not None:
+            self.__cache_put(filename=filename, contents=output, filter_string=result_key)
+            return(output)
+          output = False
+
+        offset, raw_key, grep_key = self.__local_cache_keys(filename, grep, time_filter, delimiter)
+        filtered_key = '%s>=%s' %(grep_key or raw_key or '', int(self.config['logsfrom'])) if time_filter and self.config['logsfrom'] else None
+
+        if filtered_key:
+          output = self.__cache_get(filename=filename, filter_string=filtered_key)
+          if output != False:
+            time_filter = False
         if output == False:
-          file = open(filename)
-          output = file.read().splitlines()
-          file.close()
-          self.filecache.put(filename=filename, contents=output)
-
-          if grep:
-            newout = []
-            for line in output:
-              if re.search(grep, line):
-                newout.append(line)
-            self.debug("%s lines removed (%s remaining) after grepping %s" %(len(output)-len(newout), len(newout), grep), code.LOG_DEBUG)
-            output = newout
-            self.filecache.put(filename=filename, contents=output, filter_string=grep)
-      else:
-        output = self.filecache.get(filename=filename, filter_string=grep)
+          output = self.__cached_contents(filename, grep, raw_key, grep_key)[0]
+
+        parallel = None
         if output == False:
-          if grep:
-            output = self.run_command('egrep \'%s\' %s' %(grep, filename)).stdout
+          parallel = self.__read_local_file_parallel(filename, offset, grep, time_filter)
+        if parallel:
+          output, time_filter = parallel
+          if not time_filter and filtered_key:
+            self.__cache_put(filename=filename, contents=output, filter_string=filtered_key)
           else:
-            output = self.run_command('cat %s' %filename).stdout
-          self.filecache.put(filename=filename, filter_string=grep, contents=output)
-        else:
-          self.debug("Re-used cached contents for %s" %filename, code.LOG_DEBUG)
+            self.__cache_put(filename=filename, contents=output, filter_string=grep_key if grep else raw_key)
+        elif output == False:
+          # The file is opened once, so members of compressed tar archives are decompressed once
+          output = None
+          with self.__open_local(filename) as file:
+            compression = self.__compression(filename, file)
+            if compression:
+              output = self.__read_compressed_file(filename, compression, grep, raw=file)
+            elif grep:
+              output = self.__grep_local_file(filename, offset, grep)
+            if output == None:
+              file.seek(offset)
+              contents = file.read()
+          if output != None:
+            if grep:
+              self.debug("%s lines found after grepping %s" %(len(output), grep), code.LOG_DEBUG)
+            self.__cache_put(filename=filename, contents=output, filter_string=grep_key if grep else raw_key)
+          else:
+            output = Lines.split(contents)
+            self.__cache_put(filename=filename, contents=output, filter_string=raw_key)
+
+            if grep:
+              start = timer()
+              match = self.__line_matcher(grep).match
+              newout = []
+              for line in output:
+                if match(line):
+                  newout.append(line)
+              self.debug("%s lines removed (%s remaining) after grepping %s in %.2f seconds" %(len(output)-len(newout), len(newout), grep, timer() - start), code.LOG_DEBUG)
+              output = newout
+              self.__cache_put(filename=filename, contents=output, filter_string=grep_key)
+      else:
+        output, time_filter = self.__read_remote_file(filename, grep, time_filter)
     except Exception as e:
       self.debug("Could not read %s: %s" %(filename, e), code.LOG_DEBUG)
       return([])
 
-    if filename.split('.')[-1].split('/')[-1] in log_suffixes or force_time_filter:
+    if time_filter:
       output = self.__filter_logs(output, filename=filename)
     else:
       self.debug("Skipping timestamp filtering for %s" %filename, code.LOG_DEBUG)
 
     if delimiter:
-      self.debug("Found delimiter for %s: %s" %(filename, delimiter), code.LOG_DEBUG)
-      output.reverse()
-      index = [i for i, s in enumerate(output) if delimiter in s]
-      if index:
-        self.debug("Delimiter string \"%s\" found with indexes %s" %(delimiter, index), code.LOG_DEBUG)
-        output = output[:index[0]]
-      else:
-        self.debug("Couldn't find any occurrences of %s." %delimiter, code.LOG_DEBUG)
-      output.reverse()
+      output = self.__after_last(output, delimiter, filename)
+
+    if isinstance(output, list) and len(output) >= Lines.min_lines:
+      # Large results are kept as a single buffer rather than one object per line
+      output = Lines.pack(output)
+    elif isinstance(output, Lines) and len(output) < Lines.min_lines:
+      output = list(output)
+    if result_key and (filtered or delimiter):
+      self.__cache_put(filename=filename, contents=output, filter_string=result_key)
+    if persistent:
+      self.__store_results(filename, result_key, output)
 
     self.debug(output, code.LOG_JEDIMASTER)
     return(output)
 
-  def run_command(self, command, silence_cvpi_warning=False, cacheable=False, all_nodes=False, timeout=None):
+  def read_diagnostic_file(self, pointer):
+    """ Returns the line of a local file a diagnostic file entry set by set_status() points to.
+    Entries with a byte offset are read with a single seek, unless the file is compressed, while
+    "filename:line_number" entries are read up to that line.
+
+    Args:
+        pointer (str): Diagnostic file entry
+
+    Returns:
+        str: Line the entry points to, or None if it doesn't point to a line of a local file
+    """
+    match = re.match(r'^(.+):(\d+)(?:@(\d+))?$', pointer)
+    if not match or not self.is_using_local_logs():
+      return(None)
+    filename, line_number, offset = match.group(1), int(match.group(2)), match.group(3)
+    line = None
+    try:
+      if offset is not None and self.__is_seekable(filename):
+        with self.__open_local(filename) as file:
+          file.seek(int(offset))
+          line = file.readline()
+      else:
+        lines = self.__iter_physical_lines(filename, int(offset or 0))
+        for _, number, line in lines:
+          if offset is not None or number == line_number:
+            break
+          line = None
+        lines.close()
+    except Exception as e:
+      self.debug("Could not read %s: %s" %(pointer, e), code.LOG_DEBUG)
+    if not line:
+      return(None)
+    return(line.decode('utf-8', 'replace').rstrip('\r\n'))
+
+  def run_command(self, command, silence_cvpi_warning=False, cacheable=False, all_nodes=False, timeout=None, cache_ttl=None, cache_invalidation=None):
     """ Runs a command on the current node. This should be used only when running a
     live check.
 
@@ -1333,12 +4301,18 @@ class Bug(object):
         command (str): Command to run on the node
         silence_cvpi_warning (bool): Do not print a warning message when running cvpi
             commands. This shouldn't be normally used by bugchecks. Default: False
+        cacheable (bool): Keep the output in the file cache for other bugchecks. Default: False
+        cache_ttl (int): With cacheable, also keep a successful output in the cache directory
+            for this many seconds, so following runs re-use it. Only done when cache_directory or
+            results_cache_size are configured. Default: None
+        cache_invalidation (list): Files on the node whose modification times invalidate the output
+            kept across runs when they change. Default: None
 
     Returns:
         Output object: object containing the following attributes:
           - members (list): list of hosts the command ran on. Each member is an Output object on its own, containing the attributes below.
-          - stdout (list): Lines generated on the host's stdout if running on a single host, ['{multiple}'] if running on multiple hosts
-          - stderr (list): Lines generated on the host's stderr if running on a single host, ['{multiple}'] if running on multiple hosts
+          - stdout (list): Lines generated on the host's stdout if running on a single host, ['{multiple}'] if running on multiple hosts. Local outputs of Lines.min_lines lines or more are a Lines, a read only list
+          - stderr (list): Lines generated on the host's stderr if running on a single host, ['{multiple}'] if running on multiple hosts. Local outputs of Lines.min_lines lines or more are a Lines, a read only list
           - exit_code (int): Exit code of the command if running on a single host. If running on multiple hosts it will contain the value of a non-OK return from members or OK if all members return OK.
     """
     class Output(object):
@@ -1401,13 +4375,20 @@ class Bug(object):
     self.debug("Running command %s" %command, code.LOG_DEBUG)
     self.debug("Target Host: %s" %target_host, code.LOG_JEDI)
     self.debug("Local Host: %s" %current_host, code.LOG_JEDI)
+    command_file = None
     if cacheable:
-      retval = self.filecache.get(filename=command)
+      retval = self.__cache_get(filename=command)
+      if retval == False and cache_ttl:
+        command_file = self.__command_file(command, target_host, all_nodes, cache_invalidation)
+        hosts = self.__load_command(command_file, cache_ttl)
+        if hosts:
+          retval = Output(hosts=hosts)
+          self.__cache_put(filename=command, contents=retval)
 
     if (cacheable and retval == False) or not cacheable:
       start = timer()
       if cacheable:
-        self.filecache.lock(filename=command)
+        self.__cache_lock(filename=command)
 
       cmdresult = {}
       if all_nodes:
@@ -1437,19 +4418,24 @@ class Bug(object):
       end = timer()
       elapsed = timedelta(microseconds=end-start)
       if cacheable:
-        self.filecache.put(filename=command, contents=retval)
-        self.filecache.unlock(filename=command)
+        self.__cache_put(filename=command, contents=retval)
+        self.__cache_unlock(filename=command)
+        self.__store_command(command_file, command, cmdresult)
         self.debug("Cached command output after %sus" %elapsed, code.LOG_JEDI)
     else:
       self.debug("Retrieved %s contents from %s: %s" %(command, self.filecache, retval), code.LOG_DEBUG)
 
     if not all_nodes and retval.stderr:
       self.debug("Command %s returned errors: %s" %(command, retval.stderr), code.LOG_DEBUG)
+    if self.__inputs is not None and not cache_ttl and not self.is_using_local_logs():
+      self.__uncacheable = 'runs %s without cache_ttl' %command
+    self.__record_input('command', (command, all_nodes, cache_ttl, tuple(cache_invalidation or [])), self.__output_digest(retval))
 
     return(retval)
 
   def save_cluster_value(self, value, keyname=None):
     '''Saves a cluster-wide accessible value'''
+    self.__uncacheable = 'saves cluster values'
     retval = False
     if self.config.get('name'):
       if not keyname:
@@ -1464,6 +4450,7 @@ class Bug(object):
         self.primary=primary
         self.secondary=secondary
         self.tertiary=tertiary
+    self.__uncacheable = 'reads cluster values'
     retval = Return_Value()
     if not keyname:
       keyname=self.config.get('name')
@@ -1476,6 +4463,15 @@ class Bug(object):
     """ Stub scan() method. This MUST be overriden by the bugcheck otherwise it will
     only raise an error and the bugcheck won't be run.
 
+    The files, directories and command outputs read through read_file(), iter_file(),
+    get_matches(), walk() and run_command() during a scan are fingerprinted, and the status
+    and the attributes set by the bugcheck are kept in the cache directory along with the
+    bugcheck and Bug versions. Following runs restore them without scanning when none of the
+    inputs changed. Scans given arguments are always run. Scans using cluster
+    values, certificates() or other bugchecks are not kept, and bugchecks depending on
+    anything else, such as the current time, should set scan.fingerprint to false in their
+    metadata.
+
     Raises:
         NotImplementedError: A scan action was not defined on the bugcheck
     """
@@ -1505,11 +4501,55 @@ class Bug(object):
             pods or files, but can be anything.
         has_run: Indicates whether or not a bugcheck has been run at least once. This is
             intended to be used to help debugging and shouldn't be normally set.
+        diagnostic_files (list): Where the issue was found. Entries can be strings, usually
+            "filename:line_number", or (filename, record) tuples with the records returned by
+            read_file(records=True) or get_matches(records=True), or records of rotated log
+            sets as they are. Records are stored as "filename:line_number@byte_offset" pointers,
+            which read_diagnostic_file() resolves with a single seek.
     """
     self.status['code'] = value
     self.status['message'] = message
     self.status['extra'] = extra
     self.status['has_run'] = has_run
-    self.status['diagnostic_files'] = diagnostic_files
+    self.status['diagnostic_files'] = [self.__diagnostic_pointer(entry) for entry in diagnostic_files]
     self.debug("Status set: " + str(self.status), code.LOG_DEBUG)
 
+  def walk(self, directory):
+    """ Generates the file names in a directory tree like os.walk(). When reading cvpi_debug_all
+    bundles the directory may be inside a tar archive, which is then treated as a directory, so
+    bundles don't need to be extracted. Files found this way can be read with read_file().
+
+    Args:
+        directory (str): Path to the directory
+
+    Returns:
+        generator: (root, dirs, files) tuples for each directory in the tree, from the top down.
+    """
+    self.__record_input('walk', directory)
+    archive = self.__split_archive_path(directory)
+    if not archive:
+      for entry in os.walk(directory):
+        yield entry
+      return
+
+    prefix = '' if archive[1] == '.' else archive[1] + '/'
+    tree = {'': ([], [])}
+    for name in sorted(self.__tar_index(archive[0])):
+      if not name.startswith(prefix):
+        continue
+      parts = name[len(prefix):].split('/')
+      for depth in range(len(parts) - 1):
+        parent, child = '/'.join(parts[:depth]), '/'.join(parts[:depth + 1])
+        if child not in tree:
+          tree[child] = ([], [])
+          tree[parent][0].append(parts[depth])
+      tree['/'.join(parts[:-1])][1].append(parts[-1])
+
+    if not tree[''][0] and not tree[''][1]:
+      return
+    pending = ['']
+    while pending:
+      path = pending.pop(0)
+      dirs, files = tree[path]
+      yield(os.path.join(directory, path) if path else directory, dirs, files)
+      pending[0:0] = [path + '/' + name if path else name for name in dirs]
@@ -11,12 +11,12 @@ class cert_issues(Bug):
     self.debug("Initializing dependencies", code.LOG_DEBUG)
     from bugchecks.cvp_deadline_exceeded import cvp_deadline_exceeded
     from bugchecks.k8s_pods_crashloop import k8s_pods_crashloop
-    self.service_auth_error_message = 'rpc error: code = Unauthenticated desc = not authenticated'
     self.deadline_services = cvp_deadline_exceeded()
     self.deadline_services.configure(
       bootstrap=True,
       connection=self.config['connection'],
       filecache=self.filecache,
+      metadata_json=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cvp_deadline_exceeded.json'),
       node_config=self.config['node_config'],
       debug_level=self.config['debug']['level'])
     self.deadline_services.scan()
@@ -65,8 +65,8 @@ class cert_issues(Bug):
       value = code.WARNING
       services = list(set(deadline_services).intersection(telltale_services))
 
-    logfile = self.local_directory('commands')+'/journalctl'
-    service_auth_errors = self.read_file(logfile, grep=self.service_auth_error_message)
+    logfile, regex = self.get_subscriptions()[0]
+    service_auth_errors = [line for _, line in self.get_matches(logfile, regex)]
     if service_auth_errors and value == code.OK:
       value = code.INFO
 
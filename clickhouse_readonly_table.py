@@ -30,10 +30,11 @@ class clickhouse_readonly_table(Bug):
             logfile = self.local_directory(directory_type='logs')+'/clickhouse/clickhouse-server.err.log'
         else:
             logfile = '/cvpi/clickhouse/logs/clickhouse-server/clickhouse-server.err.log'
-        logs = self.read_file(logfile, grep='::Exception')
+        logs = self.read_file(logfile, grep='::Exception', records=True)
 
         line_number=1
-        for line in logs:
+        for record in logs:
+            line = record[-1]
             for error_message in self.error_messages:
                 if error_message in line:
                     if not issues.get(error_message):
@@ -55,7 +56,10 @@ class clickhouse_readonly_table(Bug):
                             namespace = table.groups()[0] + '.' + table.groups()[1]
                             if namespace not in issues[error_message]['tables']:
                                 issues[error_message]['tables'].append(namespace)
-                        diagnostic_entry = "grep '::Exception' %s| awk 'NR==%s'" %(logfile, line_number)
+                        if self.is_using_local_logs():
+                            diagnostic_entry = (logfile, record)
+                        else:
+                            diagnostic_entry = "grep '::Exception' %s| awk 'NR==%s'" %(logfile, line_number)
                         diagnostic_files.append(diagnostic_entry)
                     else:
                         self.debug("Could not extract paths or tables from line: %s" %line, code.LOG_WARNING)
@@ -12,30 +12,27 @@ class cvp_deadline_exceeded(Bug):
     value = code.OK
     message = None
     services = []
-    check_regex = r'event\.go.*Name:\"(.*?)".*DeadlineExceeded'
     diagnostic_files = []
 
     if self.is_using_local_logs():
-      logfile = self.local_directory(directory_type='commands')+'/journalctl'
-      journal = self.read_file(logfile)
+      logfile, check_regex = self.get_subscriptions()[0]
+      journal = self.get_matches(logfile, check_regex, records=True)
     else:
-      logfile = "journalctl -S '%s' --no-page | grep DeadlineExceeded" %self.journalctl_days
-      journal = self.run_command(logfile).stdout
+      logfile = "journalctl -S '%s' --no-page | grep -E 'event\\.go.*DeadlineExceeded'" %self.journalctl_days
+      journal = [(None, line_number, line) for line_number, line in enumerate(self.run_command(logfile).stdout, 1)]
 
-    line_number=1
-    for line in journal:
-      match = re.search(check_regex, line)
+    for record in journal:
+      # Lines were already selected by the subscribed regex or the grep, so only the service name is searched
+      match = re.search(r'.*Name:\"(.*?)"', record[-1])
       if match:
         match = match.groups()[0]
         if 'service-' in match:
           service = match.split('-')[1]
         else:
           service = match.split('-')[0]
-        diagnostic_entry = "%s:%s" %(logfile, line_number)
-        diagnostic_files.append(diagnostic_entry)
+        diagnostic_files.append((logfile, record))
         if service not in services:
           services.append(service)
-      line_number += 1
 
     if services:
       value = code.ERROR
@@ -18,19 +18,20 @@ class cvp_events_userinteraction(Bug):
 
         if self.is_using_local_logs():
             logfile = self.local_directory(directory_type='root')+'/turbine-version-events-active.log'
-            logs = self.read_file(logfile, grep=grep)
+            logs = self.read_file(logfile, grep=grep, records=True)
         else:
             logfile = "kubectl logs -l 'app=turbine-version-events-active'|grep '%s'" % grep
-            logs = self.run_command(logfile).stdout
+            logs = [(None, None, line) for line in self.run_command(logfile).stdout]
 
-        line_number=1
-        for line in logs:
-            event = re.search(event_search_regex, line).groups()[0]
+        for record in logs:
+            event = re.search(event_search_regex, record[-1]).groups()[0]
             if event and event not in not_found_events:
                 not_found_events.append(event)
-                diagnostic_entry = "grep '%s.*%s' %s" %(event, grep, logfile)
+                if record[0] is not None:
+                    diagnostic_entry = (logfile, record)
+                else:
+                    diagnostic_entry = "grep '%s.*%s' %s" %(event, grep, logfile)
                 diagnostic_files.append(diagnostic_entry)
-            line_number += 1
 
         if not_found_events:
             value = code.ERROR
@@ -122,7 +122,7 @@ class cvpi_resources(Bug):
       self.debug("No stored values found for the %s node" %self.get_node_role(), code.LOG_DEBUG)
 
     if not resources:
-      resources = self.run_command("cvpi resources --yaml", silence_cvpi_warning=True, cacheable=True).stdout
+      resources = self.run_command("cvpi resources --yaml", silence_cvpi_warning=True, cacheable=True, cache_ttl=300).stdout
       resources = yaml.safe_load('\n'.join(resources))
       self.save_cluster_value(resources)
 
@@ -27,7 +27,7 @@ class cvpi_status(Bug):
         status = {}
 
         cvpi_check_command = "cvpi status --yaml"
-        cvpi_check_output = self.run_command(cvpi_check_command, silence_cvpi_warning=True, cacheable=True).stdout
+        cvpi_check_output = self.run_command(cvpi_check_command, silence_cvpi_warning=True, cacheable=True, cache_ttl=60).stdout
         index_component = self.__get_index(cvpi_check_output, 'Component Status')
         index_cluster = self.__get_index(cvpi_check_output, 'Cluster Status')
         index_systemd = self.__get_index(cvpi_check_output, 'Systemd Unit Status')
@@ -12,7 +12,6 @@ class docker_cgroup(Bug):
 
         self.grub_template = '/etc/default/grub'
         self.is_configured = False
-        self.log_check_files = ['journalctl', 'kube_pod']
 
     def scan(self):
         value = code.OK
@@ -25,15 +24,11 @@ class docker_cgroup(Bug):
 
         if self.is_using_local_logs():
             was_checked = False
-            for file in self.log_check_files:
-                contents = self.read_file(self.local_directory(directory_type='commands')+'/'+file)
-                line_number = 1
-                for line in contents:
-                    if 'cannot allocate memory' in line and 'cgroup' in line:
-                        diagnostic_entry = "%s:%s" %(self.local_directory(directory_type='commands')+'/'+file, line_number)
-                        diagnostic_files.append(diagnostic_entry)
-                        is_affected = True
-                    line_number += 1
+            for logfile, regex in self.get_subscriptions():
+                contents = self.get_matches(logfile, regex, records=True)
+                for record in contents:
+                    diagnostic_files.append((logfile, record))
+                    is_affected = True
         else:
             is_configured = self.run_command("grep -E ^GRUB_CMDLINE_LINUX.*cgroup.memory=nokmem.* " + self.grub_template).stdout
             is_applied = self.run_command("grep cgroup.memory=nokmem /proc/cmdline").stdout
@@ -1,6 +1,5 @@
 from bugchecks.bug import Bug
 import lib.return_codes as code
-import os
 import re
 
 class hbase_corrupted_procedures(Bug):
@@ -15,7 +14,7 @@ class hbase_corrupted_procedures(Bug):
 
     if self.is_using_local_logs():
       directory = self.local_directory(directory_type='logs')+'/hbasemaster'
-      for root, dirs, files in os.walk(directory):
+      for root, dirs, files in self.walk(directory):
         for file in files:
           if file.endswith('.log'):
             logfile = directory + '/' + file
@@ -2,7 +2,6 @@
 from bugchecks.bug import Bug
 import lib.return_codes as code
 
-import os
 import re
 
 class hbase_offline_regions(Bug):
@@ -24,7 +23,7 @@ class hbase_offline_regions(Bug):
         logfile = None
 
         if self.is_using_local_logs():
-            for root, dirs, files in os.walk(self.local_directory(directory_type='logs')+'/hbasemaster/'):
+            for root, dirs, files in self.walk(self.local_directory(directory_type='logs')+'/hbasemaster/'):
                 for file in files:
                     if file.endswith('.log'):
                         logfile = file
@@ -1,7 +1,6 @@
 # pylint: disable=invalid-name, useless-super-delegation, line-too-long, consider-using-dict-items, missing-class-docstring
 from bugchecks.bug import Bug
 import lib.return_codes as code
-import os
 import re
 
 class hbase_unassigned_regions(Bug):
@@ -13,14 +12,14 @@ class hbase_unassigned_regions(Bug):
         value = code.OK
         affected_regions = []
         logfile = None
-        for root, dirs, files in os.walk(self.local_directory(directory_type='logs')+'/hbasemaster/'):
+        for root, dirs, files in self.walk(self.local_directory(directory_type='logs')+'/hbasemaster/'):
             for file in files:
                 if file.endswith('.log'):
                     logfile = file
 
         if logfile:
             self.debug("Found hbase master log file: %s" %logfile, code.LOG_DEBUG)
-            file = self.read_file(self.local_directory(directory_type='logs')+'/hbasemaster/'+logfile)
+            file = self.read_file(self.local_directory(directory_type='logs')+'/hbasemaster/'+logfile, rotated=True)
             if file:
                 for line in file:
                     if 'CatalogJanitor' in line and 'unknown_server' in line:
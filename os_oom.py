@@ -39,43 +39,29 @@ class os_oom(Bug):
         kubelet_journal_file = self.local_directory(directory_type='logs')+'/kubelet_journalctl'
         system_journal_file = self.local_directory(directory_type='commands')+'/journalctl'
 
-        try:
-            kubelet_journal = self.read_file(kubelet_journal_file)
-        except:
-            self.debug("Could not read " + file, code.LOG_WARNING)
-            kubelet_journal = []
-
-        try:
-            system_journal = self.read_file(system_journal_file)
-        except:
-            self.debug("Could not read " + file, code.LOG_WARNING)
-            system_journal = []
-
-        line_number=1
-        for line in kubelet_journal:
-            oom, process = self.__check_oom(line)
+        subscriptions = dict(self.get_subscriptions())
+        kubelet_journal = self.get_matches(kubelet_journal_file, subscriptions[kubelet_journal_file], records=True)
+        system_journal = self.get_matches(system_journal_file, subscriptions[system_journal_file], records=True)
+
+        for record in kubelet_journal:
+            oom, process = self.__check_oom(record[-1])
             if oom != code.OK:
                 status = code.ERROR
-                diagnostic_entry = "%s:%s" %(kubelet_journal_file, line_number)
-                diagnostic_files.append(diagnostic_entry)
+                diagnostic_files.append((kubelet_journal_file, record))
                 if process and process not in processes:
                     processes.append(process)
                 if 'kubelet' not in journal:
                     journal.append('kubelet')
-            line_number += 1
 
-        line_number=1
-        for line in system_journal:
-            oom, process = self.__check_oom(line)
+        for record in system_journal:
+            oom, process = self.__check_oom(record[-1])
             if oom != code.OK:
                 status = code.ERROR
-                diagnostic_entry = "%s:%s" %(system_journal_file, line_number)
-                diagnostic_files.append(diagnostic_entry)
+                diagnostic_files.append((system_journal_file, record))
                 if process and process not in processes:
                     processes.append(process)
                 if 'system' not in journal:
                     journal.append('system')
-            line_number += 1
 
         return(status, processes, journal, diagnostic_files)
 